@@ -1,19 +1,861 @@
-from ultralytics import YOLO
 import sys
 import os
 import cv2
+import csv
+import json
 import time
+import hashlib
+import queue
+import threading
+from collections import deque
 import numpy as np
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QLabel, QFileDialog,
                              QMessageBox, QGroupBox, QCheckBox,
                              QProgressBar, QTextEdit, QFrame, QSplitter,
                              QSizePolicy, QGridLayout, QScrollArea, QSlider,
-                             QStackedWidget, QGraphicsDropShadowEffect)
-from PyQt5.QtCore import QTimer, Qt, pyqtSignal, QThread,  QSharedMemory
-from PyQt5.QtGui import QImage, QPixmap, QFont, QColor, QIcon
-from PIL import Image
+                             QStackedWidget, QGraphicsDropShadowEffect, QComboBox,
+                             QSpinBox, QDoubleSpinBox, QLineEdit, QDialog, QInputDialog)
+from PyQt5.QtCore import QTimer, Qt, pyqtSignal, QThread,  QSharedMemory, QPointF
+from PyQt5.QtGui import QImage, QPixmap, QFont, QColor, QIcon, QPainter, QPen, QPolygonF
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+# 推理统一使用的最低置信度，界面上的阈值只对保留下来的原始检测框做过滤
+CONF_FLOOR = 0.1
+# 默认推理输入尺寸，与训练尺寸一致
+DEFAULT_IMGSZ = 640
+# 各视频/摄像头的检测区域（ROI）配置文件
+ROI_CONFIG = "roi.json"
+
+
+def resolve_app_path(file_name="best.pt"):
+    """返回程序目录下的文件路径（模型、缓存等，兼容打包后的环境）"""
+    # 判断是否是打包后的环境
+    if getattr(sys, 'frozen', False):
+        # 打包后，模型等文件应该在exe同目录下
+        return os.path.join(os.path.dirname(sys.executable), file_name)
+    # 开发环境中直接使用当前目录
+    return file_name
+
+
+def read_image(path):
+    """读取图片为 BGR 数组，webp 通过 PIL 解码，失败返回 None"""
+    if path.lower().endswith('.webp'):
+        try:
+            from PIL import Image
+            return cv2.cvtColor(np.array(Image.open(path).convert('RGB')), cv2.COLOR_RGB2BGR)
+        except:
+            return None
+    return cv2.imread(path)
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """计算文件内容的 SHA1"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_detections(result):
+    """把 YOLO 结果转为 (N, 6) 数组: x1, y1, x2, y2, conf, cls"""
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    return result.boxes.data[:, :6].cpu().numpy().astype(np.float32)
+
+
+def filter_detections(dets, conf_threshold):
+    """按置信度阈值过滤原始检测框"""
+    return dets[dets[:, 4] >= conf_threshold]
+
+
+def render_detections(image, dets, names):
+    """按原始检测框绘制标注图，样式与 results[0].plot() 一致"""
+    from ultralytics.engine.results import Results
+    return Results(image, path=None, names=names, boxes=dets).plot()
+
+
+def tile_origins(length, tile, stride):
+    """一维方向上各块的起点，最后一块贴齐边缘"""
+    if length <= tile:
+        return [0]
+    return list(range(0, length - tile, stride)) + [length - tile]
+
+
+def merge_detections(dets, threshold=0.6):
+    """跨块合并重复框：同类框按分数从高到低保留，与已保留框的交集占较小框面积超过 threshold 的丢弃。
+
+    用交集/较小框面积而不是 IoU，被块边界截断的半条鱼也能被完整的框合并掉。
+    """
+    if len(dets) < 2:
+        return dets
+    dets = dets[np.argsort(-dets[:, 4])]
+    x1, y1, x2, y2 = dets[:, 0], dets[:, 1], dets[:, 2], dets[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    suppressed = np.zeros(len(dets), dtype=bool)
+    keep = []
+    for i in range(len(dets)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        rest = slice(i + 1, None)
+        iw = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        ios = iw * ih / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        suppressed[rest] |= (ios > threshold) & (dets[rest, 5] == dets[i, 5])
+    return dets[keep]
+
+
+def tiled_detect(model, image, tile=640, overlap=0.2, max_tiles=48, batch=8, conf=CONF_FLOOR):
+    """分块推理：把高分辨率图片切成相互重叠的块分批推理，再跨块合并检测框，返回 (N, 6) 数组。
+
+    整图也推理一次，跨越多个块的大目标仍能完整检出。块数超过 max_tiles 时放大块尺寸
+    （推理时仍缩放到模型输入尺寸），使 8K 图片的耗时有上限。
+    """
+    h, w = image.shape[:2]
+    if max(h, w) <= tile * 1.5:
+        return extract_detections(model(image, conf=conf, verbose=False)[0])
+
+    while True:
+        stride = max(1, int(tile * (1 - overlap)))
+        xs, ys = tile_origins(w, tile, stride), tile_origins(h, tile, stride)
+        if len(xs) * len(ys) <= max_tiles:
+            break
+        tile = int(tile * 1.25)
+
+    parts = [extract_detections(model(image, conf=conf, verbose=False)[0])]
+    origins = [(x, y) for y in ys for x in xs]
+    # 多个块合成一批前向推理，摊薄每次调用的开销
+    for i in range(0, len(origins), batch):
+        chunk = origins[i:i + batch]
+        results = model([image[y:y + tile, x:x + tile] for x, y in chunk], conf=conf, verbose=False)
+        for (x, y), result in zip(chunk, results):
+            dets = extract_detections(result)
+            dets[:, [0, 2]] += x
+            dets[:, [1, 3]] += y
+            parts.append(dets)
+    return merge_detections(np.concatenate(parts))
+
+
+class RegionMask:
+    """感兴趣区域：一个或多个多边形（0~1 归一化坐标，与分辨率无关）。
+
+    推理时只送入多边形的外接矩形，检测框映射回整帧后丢弃中心落在多边形外的结果。
+    """
+
+    def __init__(self, polygons):
+        self.polygons = [np.asarray(p, dtype=np.float32) for p in polygons if len(p) >= 3]
+        self._shape = None
+        self._mask = None
+        self._rect = None
+
+    def __bool__(self):
+        return bool(self.polygons)
+
+    def _prepare(self, shape):
+        # 多边形按帧尺寸栅格化一次，尺寸不变时复用
+        if shape == self._shape:
+            return
+        h, w = shape
+        points = [np.round(p * (w - 1, h - 1)).astype(np.int32) for p in self.polygons]
+        self._mask = np.zeros((h, w), dtype=np.uint8)
+        cv2.fillPoly(self._mask, points, 255)
+        corners = np.concatenate(points)
+        x1, y1 = np.clip(corners.min(axis=0), 0, (w - 1, h - 1))
+        x2, y2 = np.clip(corners.max(axis=0) + 1, 1, (w, h))
+        self._rect = (int(x1), int(y1), int(x2), int(y2))
+        self._shape = shape
+
+    def crop(self, frame):
+        """返回 (外接矩形内的画面, 左上角偏移)"""
+        self._prepare(frame.shape[:2])
+        x1, y1, x2, y2 = self._rect
+        return frame[y1:y2, x1:x2], (x1, y1)
+
+    def restore(self, dets, offset):
+        """把裁剪图上的检测框平移回整帧，只保留中心在多边形内的框"""
+        dets = dets.copy()
+        dets[:, [0, 2]] += offset[0]
+        dets[:, [1, 3]] += offset[1]
+        h, w = self._mask.shape
+        cx = np.clip(((dets[:, 0] + dets[:, 2]) / 2).astype(int), 0, w - 1)
+        cy = np.clip(((dets[:, 1] + dets[:, 3]) / 2).astype(int), 0, h - 1)
+        return dets[self._mask[cy, cx] > 0]
+
+
+def run_detection(model, frames, rois=None, **kwargs):
+    """多帧合成一批推理，返回逐帧的 (N, 6) 检测框；设置了 ROI 的帧只推理 ROI 的外接矩形"""
+    rois = rois or [None] * len(frames)
+    inputs, offsets = [], []
+    for frame, roi in zip(frames, rois):
+        if roi:
+            crop, offset = roi.crop(frame)
+        else:
+            crop, offset = frame, None
+        inputs.append(crop)
+        offsets.append(offset)
+    results = model(inputs, conf=CONF_FLOOR, verbose=False, **kwargs)
+    dets_list = []
+    for result, roi, offset in zip(results, rois, offsets):
+        dets = extract_detections(result)
+        dets_list.append(roi.restore(dets, offset) if roi else dets)
+    return dets_list
+
+
+def load_roi_config(path):
+    """读取 ROI 配置 {来源: [多边形, ...]}，文件不存在或损坏时返回空配置"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        return config if isinstance(config, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_roi_config(path, config):
+    # 先写临时文件再替换，避免写到一半时留下损坏的配置
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def frame_to_qimage(img, width, height, buffer=None):
+    """把 BGR 帧按比例缩放到 width x height 以内并直接包装成 BGR888 的 QImage。
+
+    先缩小再交给 Qt，省掉整幅图的颜色转换和平滑缩放；buffer 尺寸不变时复用，
+    避免每帧分配内存。返回 (QImage, buffer)，QImage 引用 buffer 的内存。
+    """
+    h, w = img.shape[:2]
+    scale = min(width / w, height / h)
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    if buffer is None or buffer.shape != (size[1], size[0], 3):
+        buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    cv2.resize(img, size, dst=buffer, interpolation=interpolation)
+    return QImage(buffer.data, size[0], size[1], buffer.strides[0], QImage.Format_BGR888), buffer
+
+
+# 级联模式中负责复核的大模型，与 best.pt 放在同一目录、类别一致
+CASCADE_MODEL = "best_large.pt"
+
+# 可选的 CPU 推理后端：名称 -> (显示名, ultralytics 导出格式)
+BACKENDS = {
+    "pytorch": ("PyTorch", None),
+    "onnx": ("ONNX Runtime", "onnx"),
+    "openvino": ("OpenVINO", "openvino"),
+    "onnx_int8": ("ONNX INT8", None),  # 由 quantize_model.py 生成
+}
+
+
+def backend_artifact(model_path, backend):
+    """返回某个后端对应的模型文件路径（与 best.pt 放在同一目录）"""
+    stem = os.path.splitext(model_path)[0]
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    if backend == "onnx_int8":
+        return stem + "_int8.onnx"
+    return model_path
+
+
+class Detector:
+    """检测模型封装：调用方式与 YOLO 对象相同，同时记录各阶段耗时"""
+
+    def __init__(self, model, backend="pytorch"):
+        self.model = model
+        self.backend = backend
+        self.names = model.names
+        self.speed = {}  # 预处理/推理/后处理耗时（毫秒，指数平滑）
+        # ultralytics 的预测器在每次调用间保存参数和输入尺寸，不能被多个线程同时调用；
+        # 图片预取与视频/摄像头线程共用同一个模型，调用需要串行
+        self._lock = threading.Lock()
+
+    @property
+    def backend_name(self):
+        return BACKENDS.get(self.backend, (self.backend,))[0]
+
+    def __call__(self, source, **kwargs):
+        # ONNX/OpenVINO 模型没有默认 imgsz，ultralytics 会沿用上一次调用传入的尺寸，
+        # 摄像头降档后的小尺寸会影响之后的图片/视频检测，因此每次都显式传入
+        kwargs.setdefault("imgsz", DEFAULT_IMGSZ)
+        with self._lock:
+            results = self.model(source, **kwargs)
+            for stage, ms in results[0].speed.items():
+                if ms is not None:
+                    prev = self.speed.get(stage)
+                    self.speed[stage] = ms if prev is None else 0.9 * prev + 0.1 * ms
+        return results
+
+    def warmup(self, imgsz=DEFAULT_IMGSZ):
+        """用空白图推理一次，完成内存分配和算子初始化，不计入耗时统计"""
+        with self._lock:
+            self.model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), conf=CONF_FLOOR, imgsz=imgsz, verbose=False)
+
+    @classmethod
+    def load(cls, model_path, backend="pytorch"):
+        """加载指定后端；ONNX/OpenVINO 产物不存在时由 best.pt 现场导出"""
+        from ultralytics import YOLO
+        path = backend_artifact(model_path, backend)
+        export_format = BACKENDS[backend][1]
+        if export_format and not os.path.exists(path):
+            # 动态输入尺寸，便于批量推理和运行时调整 imgsz
+            path = YOLO(model_path).export(format=export_format, dynamic=True) or path
+        return cls(YOLO(path, task='detect'), backend)
+
+
+class CascadeDetector:
+    """两级级联检测：小模型筛查每一帧，大模型只复核置信度不确定的目标区域，以及小模型一无所获的整帧。
+
+    调用方式与 Detector 相同，返回的结果可直接交给 extract_detections。
+    """
+
+    CROP_IMGSZ = 320  # 复核裁剪区域时的输入尺寸
+    CROP_PAD = 0.15  # 裁剪时向四周扩展的比例，给大模型留一些上下文
+    MATCH_IOU = 0.3  # 大模型的框与原框 IoU 低于该值视为误检
+
+    def __init__(self, screen, refine, band=(0.25, 0.6)):
+        if list(screen.names.values()) != list(refine.names.values()):
+            raise ValueError("级联的两个模型类别不一致")
+        self.screen = screen
+        self.refine = refine
+        self.band = band  # 落在 [低, 高) 之间的小模型结果交给大模型复核
+        self.names = screen.names
+        self.speed = {}
+        self.counts = {"frames": 0, "boxes": 0, "uncertain": 0, "confirmed": 0, "empty": 0, "empty_found": 0}
+
+    @property
+    def backend_name(self):
+        return f"{self.screen.backend_name} 级联"
+
+    def warmup(self, imgsz=DEFAULT_IMGSZ):
+        self.screen.warmup(imgsz)
+        self.refine.warmup(imgsz)
+
+    def summary(self):
+        """各级命中率：多少目标需要复核、复核确认了多少、多少帧需要大模型整帧复核"""
+        c = self.counts
+        uncertain = c["uncertain"] / c["boxes"] if c["boxes"] else 0.0
+        confirmed = c["confirmed"] / c["uncertain"] if c["uncertain"] else 0.0
+        empty = c["empty"] / c["frames"] if c["frames"] else 0.0
+        found = c["empty_found"] / c["empty"] if c["empty"] else 0.0
+        return (f"级联: 复核目标 {uncertain:.0%}（确认 {confirmed:.0%}）| "
+                f"整帧复核 {empty:.0%}（检出 {found:.0%}）")
+
+    def __call__(self, source, conf=CONF_FLOOR, **kwargs):
+        start = time.perf_counter()
+        kwargs.pop("verbose", None)
+        # 整帧推理的输入尺寸；复核裁剪区域时改用 CROP_IMGSZ，整帧复核必须显式传回，
+        # 否则 ONNX/OpenVINO 大模型会沿用上一次的裁剪尺寸
+        imgsz = kwargs.pop("imgsz", DEFAULT_IMGSZ)
+        frames = source if isinstance(source, list) else [source]
+        screened = [extract_detections(r)
+                    for r in self.screen(frames, conf=conf, imgsz=imgsz, verbose=False, **kwargs)]
+        lo, hi = self.band
+
+        # 收集需要复核的裁剪区域和整帧，各合成一批交给大模型
+        crops, crop_refs, empty_frames = [], [], []
+        for i, (frame, dets) in enumerate(zip(frames, screened)):
+            self.counts["frames"] += 1
+            self.counts["boxes"] += int(np.count_nonzero(dets[:, 4] >= lo))
+            if not np.any(dets[:, 4] >= lo):
+                empty_frames.append(i)
+                continue
+            h, w = frame.shape[:2]
+            for j in np.flatnonzero((dets[:, 4] >= lo) & (dets[:, 4] < hi)):
+                x1, y1, x2, y2 = dets[j, :4]
+                pad_x, pad_y = (x2 - x1) * self.CROP_PAD, (y2 - y1) * self.CROP_PAD
+                cx1, cy1 = int(max(0, x1 - pad_x)), int(max(0, y1 - pad_y))
+                cx2, cy2 = int(min(w, x2 + pad_x)) + 1, int(min(h, y2 + pad_y)) + 1
+                crops.append(frame[cy1:cy2, cx1:cx2])
+                crop_refs.append((i, j, cx1, cy1))
+
+        refined = {}
+        if crops:
+            self.counts["uncertain"] += len(crops)
+            results = self.refine(crops, conf=conf, imgsz=self.CROP_IMGSZ, verbose=False)
+            for (i, j, ox, oy), result in zip(crop_refs, results):
+                candidates = extract_detections(result)
+                candidates[:, [0, 2]] += ox
+                candidates[:, [1, 3]] += oy
+                refined[(i, j)] = self._match(screened[i][j], candidates)
+        if empty_frames:
+            results = self.refine([frames[i] for i in empty_frames], conf=conf, imgsz=imgsz, verbose=False,
+                                  **kwargs)
+            for i, result in zip(empty_frames, results):
+                screened[i] = extract_detections(result)
+                self.counts["empty"] += 1
+                self.counts["empty_found"] += int(np.any(screened[i][:, 4] >= lo))
+
+        outputs = []
+        for i, (frame, dets) in enumerate(zip(frames, screened)):
+            rows = []
+            for j, det in enumerate(dets):
+                if (i, j) not in refined:
+                    rows.append(det)
+                elif refined[(i, j)] is not None:
+                    rows.append(refined[(i, j)])
+                    self.counts["confirmed"] += 1
+            outputs.append(np.array(rows, dtype=np.float32).reshape(-1, 6))
+
+        elapsed = (time.perf_counter() - start) * 1000 / len(frames)
+        prev = self.speed.get("inference")
+        self.speed["inference"] = elapsed if prev is None else 0.9 * prev + 0.1 * elapsed
+        return [self._result(frame, dets) for frame, dets in zip(frames, outputs)]
+
+    def _match(self, det, candidates):
+        """在大模型的结果中找与原框重叠最多的框；找不到则认为是误检，返回 None"""
+        if len(candidates) == 0:
+            return None
+        x1 = np.maximum(det[0], candidates[:, 0])
+        y1 = np.maximum(det[1], candidates[:, 1])
+        x2 = np.minimum(det[2], candidates[:, 2])
+        y2 = np.minimum(det[3], candidates[:, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        area = (det[2] - det[0]) * (det[3] - det[1])
+        areas = (candidates[:, 2] - candidates[:, 0]) * (candidates[:, 3] - candidates[:, 1])
+        iou = inter / np.maximum(area + areas - inter, 1e-6)
+        best = int(np.argmax(iou))
+        return candidates[best] if iou[best] >= self.MATCH_IOU else None
+
+    def _result(self, frame, dets):
+        import torch
+        from ultralytics.engine.results import Results
+        result = Results(frame, path=None, names=self.names, boxes=torch.from_numpy(dets))
+        result.speed = {"preprocess": None, "inference": self.speed.get("inference"), "postprocess": None}
+        return result
+
+
+class DetectionCache:
+    """检测结果磁盘缓存：以图片内容、模型和推理参数为键，超出容量时按最近使用淘汰"""
+
+    def __init__(self, cache_dir, max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}  # 文件名 -> (大小, 最近使用时间)
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in os.listdir(cache_dir):
+            if name.endswith('.npy'):
+                try:
+                    st = os.stat(os.path.join(cache_dir, name))
+                except OSError:
+                    continue
+                self._entries[name] = (st.st_size, st.st_mtime)
+        self._total = sum(size for size, _ in self._entries.values())
+
+    @staticmethod
+    def make_key(image_hash, model_hash, **params):
+        text = "|".join([image_hash, model_hash] + [f"{k}={params[k]}" for k in sorted(params)])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        name = key + '.npy'
+        path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            if name not in self._entries:
+                return None
+            try:
+                dets = np.load(path)
+            except (OSError, ValueError):
+                self._remove(name)
+                return None
+            # 用文件修改时间记录最近使用，重启后仍能按 LRU 淘汰
+            now = time.time()
+            self._entries[name] = (self._entries[name][0], now)
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+            return dets
+
+    def put(self, key, dets):
+        name = key + '.npy'
+        path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            try:
+                # 先写临时文件再替换，程序崩溃也不会留下半个缓存文件
+                with open(path + '.tmp', 'wb') as f:
+                    np.save(f, dets)
+                os.replace(path + '.tmp', path)
+                size = os.path.getsize(path)
+            except OSError as e:
+                print(f"写入检测缓存失败: {e}")
+                return
+            if name in self._entries:
+                self._total -= self._entries[name][0]
+            self._entries[name] = (size, time.time())
+            self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._entries):
+                self._remove(name)
+
+    def _evict(self):
+        # 一次淘汰到容量的 90%，避免每次写入都触发淘汰
+        for name, _ in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total <= self.max_bytes * 0.9:
+                break
+            self._remove(name)
 
+    def _remove(self, name):
+        size, _ = self._entries.pop(name, (0, 0))
+        self._total -= size
+        try:
+            os.remove(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+
+class KeyframeTracker:
+    """关键帧检测 + 稀疏光流跟踪：每 interval 帧检测一次，中间帧沿光流移动上一次的检测框"""
+
+    TRACK_WIDTH = 640  # 光流在缩小到该宽度的灰度图上计算
+    MAX_POINTS = 20  # 每个目标最多跟踪的特征点数
+
+    def __init__(self, interval=1):
+        self.interval = max(1, int(interval))
+        self._prev_gray = None
+        self._scale = 1.0
+        self._dets = np.zeros((0, 6), dtype=np.float32)
+        self._points = []  # 与 self._dets 逐行对应的特征点，缩小后的坐标
+        self._since_key = 0
+        self._force = True
+
+    def need_detection(self):
+        """本帧是否需要运行检测：到达间隔，或上一帧过半目标跟丢"""
+        return self.interval <= 1 or self._force or self._since_key >= self.interval - 1
+
+    def _gray(self, frame):
+        self._scale = min(1.0, self.TRACK_WIDTH / frame.shape[1])
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self._scale < 1.0:
+            gray = cv2.resize(gray, None, fx=self._scale, fy=self._scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def update_detections(self, frame, dets):
+        """关键帧：用新的检测结果重建跟踪点，返回 dets 本身"""
+        if self.interval <= 1:
+            return dets
+
+        gray = self._gray(frame)
+        h, w = gray.shape
+        self._points = []
+        for x1, y1, x2, y2 in dets[:, :4] * self._scale:
+            x1, y1 = max(0, int(x1)), max(0, int(y1))
+            x2, y2 = min(w, int(x2) + 1), min(h, int(y2) + 1)
+            roi = gray[y1:y2, x1:x2]
+            pts = None
+            if roi.shape[0] >= 4 and roi.shape[1] >= 4:
+                pts = cv2.goodFeaturesToTrack(roi, self.MAX_POINTS, 0.01, 3)
+            if pts is None:
+                # 纹理太少时退化为跟踪框中心
+                pts = np.array([[[(x2 - x1) / 2, (y2 - y1) / 2]]], dtype=np.float32)
+            self._points.append((pts + (x1, y1)).astype(np.float32))
+
+        self._dets = dets.copy()
+        self._prev_gray = gray
+        self._since_key = 0
+        self._force = False
+        return dets
+
+    def track(self, frame):
+        """中间帧：按光流的中位位移和尺度变化移动检测框，返回新的 dets"""
+        gray = self._gray(frame)
+        self._since_key += 1
+        if self._prev_gray is None or len(self._dets) == 0 or gray.shape != self._prev_gray.shape:
+            self._prev_gray = gray
+            return self._dets
+
+        prev_pts = np.concatenate(self._points)
+        next_pts, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_pts, None,
+                                                       winSize=(15, 15), maxLevel=2)
+        status = status.reshape(-1).astype(bool)
+
+        frame_h, frame_w = frame.shape[:2]
+        kept_dets, kept_points, lost = [], [], 0
+        start = 0
+        for det, pts in zip(self._dets, self._points):
+            end = start + len(pts)
+            ok = status[start:end]
+            old = prev_pts[start:end][ok].reshape(-1, 2)
+            new = next_pts[start:end][ok].reshape(-1, 2)
+            start = end
+            if len(new) < min(3, len(pts)):
+                lost += 1
+                continue
+
+            dx, dy = np.median(new - old, axis=0)
+            scale = 1.0
+            if len(new) >= 2:
+                spread_old = np.linalg.norm(old - old.mean(axis=0), axis=1).mean()
+                spread_new = np.linalg.norm(new - new.mean(axis=0), axis=1).mean()
+                if spread_old > 1e-3:
+                    scale = float(np.clip(spread_new / spread_old, 0.9, 1.1))
+
+            x1, y1, x2, y2 = det[:4]
+            cx = (x1 + x2) / 2 + dx / self._scale
+            cy = (y1 + y2) / 2 + dy / self._scale
+            bw, bh = (x2 - x1) * scale / 2, (y2 - y1) * scale / 2
+            box = np.clip([cx - bw, cy - bh, cx + bw, cy + bh], 0, [frame_w, frame_h, frame_w, frame_h])
+            if box[2] - box[0] < 2 or box[3] - box[1] < 2:
+                lost += 1
+                continue
+
+            moved = det.copy()
+            moved[:4] = box
+            kept_dets.append(moved)
+            kept_points.append(new.reshape(-1, 1, 2))
+
+        # 过半目标跟丢时下一帧提前检测
+        if lost * 2 > len(self._dets):
+            self._force = True
+        self._dets = np.array(kept_dets, dtype=np.float32).reshape(-1, 6)
+        self._points = kept_points
+        self._prev_gray = gray
+        return self._dets
+
+
+class MotionGate:
+    """帧差运动门控：画面相对上次推理时变化不大就跳过推理，复用上次的检测结果"""
+
+    GATE_WIDTH = 160  # 在缩小到该宽度的模糊灰度图上做帧差
+    PIXEL_DIFF = 25  # 灰度差超过该值的像素视为变化
+
+    def __init__(self, threshold=0.0, max_skip=150):
+        self.threshold = threshold  # 变化像素占比（%），0 表示关闭门控
+        self.max_skip = max_skip  # 连续跳过的最大帧数，防止光照缓慢变化时长期不推理
+        self._reference = None  # 上次推理时的画面
+        self._skipped_run = 0
+        self.total_frames = 0
+        self.skipped_frames = 0
+
+    @property
+    def skip_ratio(self):
+        return self.skipped_frames / self.total_frames if self.total_frames else 0.0
+
+    def should_infer(self, frame):
+        self.total_frames += 1
+        if self.threshold <= 0:
+            return True
+
+        scale = self.GATE_WIDTH / frame.shape[1]
+        small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self._reference is not None and self._reference.shape == small.shape \
+                and self._skipped_run < self.max_skip:
+            changed = np.count_nonzero(cv2.absdiff(small, self._reference) > self.PIXEL_DIFF)
+            if changed * 100.0 / small.size < self.threshold:
+                self._skipped_run += 1
+                self.skipped_frames += 1
+                return False
+
+        # 与上次推理时的画面比较，而不是与上一帧比较，缓慢移动的目标也不会被漏掉
+        self._reference = small
+        self._skipped_run = 0
+        return True
+
+
+class LatencyController:
+    """按延迟预算调整推理输入尺寸：持续超出预算时降一档，预计升档后仍在预算内时升一档"""
+
+    IMGSZ_LADDER = (320, 384, 448, 512, 576, 640)  # 均为 32 的倍数，最高档与训练尺寸一致
+    WINDOW = 15  # 取最近若干次推理耗时的中位数再做决定，避免单帧抖动引起来回切换
+
+    def __init__(self, budget_ms=0.0):
+        self.budget_ms = budget_ms  # 每帧处理耗时预算（毫秒），0 表示关闭
+        self.level = len(self.IMGSZ_LADDER) - 1
+        self._samples = deque(maxlen=self.WINDOW)
+
+    @property
+    def imgsz(self):
+        return self.IMGSZ_LADDER[self.level]
+
+    def set_budget(self, budget_ms):
+        self.budget_ms = budget_ms
+        self._samples.clear()
+        if budget_ms <= 0:
+            self.level = len(self.IMGSZ_LADDER) - 1
+
+    def infer_kwargs(self):
+        """传给模型的参数：关闭时使用默认输入尺寸。总是显式给出 imgsz，避免沿用上一次调用的尺寸"""
+        return {"imgsz": self.imgsz if self.budget_ms > 0 else DEFAULT_IMGSZ}
+
+    def update(self, elapsed_ms):
+        """记录一次运行了推理的帧的处理耗时，必要时切换档位"""
+        if self.budget_ms <= 0:
+            return
+        self._samples.append(elapsed_ms)
+        if len(self._samples) < self.WINDOW:
+            return
+        current = float(np.median(self._samples))
+        if current > self.budget_ms and self.level > 0:
+            self.level -= 1
+            self._samples.clear()
+        elif self.level < len(self.IMGSZ_LADDER) - 1:
+            # 耗时大致与像素数成正比，预计升档后仍留 10% 余量才升
+            ratio = (self.IMGSZ_LADDER[self.level + 1] / self.imgsz) ** 2
+            if current * ratio < self.budget_ms * 0.9:
+                self.level += 1
+                self._samples.clear()
+
+
+class FrameMailbox:
+    """单槽帧邮箱：工作线程只覆盖最新一帧，界面按刷新率取走，来不及显示的帧直接丢弃"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+        self.posted = 0
+        self.dropped = 0  # 未被界面取走就被覆盖的帧数
+
+    def post(self, frame, *meta):
+        with self._lock:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = (frame,) + meta
+            self.posted += 1
+
+    def take(self):
+        """取走最新一帧 (帧, *附加信息)，没有新帧时返回 None"""
+        with self._lock:
+            item, self._item = self._item, None
+            return item
+
+
+def process_rss_mb():
+    """当前进程的常驻内存（MB），未安装 psutil 时返回 None"""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+class PipelineStats:
+    """流水线运行统计：各阶段最近耗时的分位数、队列深度和丢帧数，可同时写出 CSV 追踪文件。
+
+    工作线程调用 record / frame_done 记录，界面每秒调用 snapshot 取汇总。
+    """
+
+    WINDOW = 300  # 每个阶段保留的最近样本数
+
+    def __init__(self, name, trace_path=None):
+        self.name = name
+        self._lock = threading.Lock()
+        self._samples = {}  # 阶段 -> 最近的耗时（毫秒）
+        self._gauges = {}  # 名称 -> 返回当前值的函数，如队列深度、丢帧数
+        self._frames = 0
+        self._last_frames = 0
+        self._last_time = self._start = time.perf_counter()
+        self._trace_file = None
+        self._trace = None
+        if trace_path:
+            try:
+                os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+                self._trace_file = open(trace_path, "w", newline="", encoding="utf-8")
+                self._trace = csv.writer(self._trace_file)
+                self._trace.writerow(["time", "pipeline", "kind", "name", "value"])
+            except OSError as e:
+                print(f"创建性能追踪文件失败: {e}")
+        self.trace_path = trace_path if self._trace is not None else None
+
+    def add_gauge(self, name, getter):
+        self._gauges[name] = getter
+
+    def record(self, stage, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            samples = self._samples.get(stage)
+            if samples is None:
+                samples = self._samples[stage] = deque(maxlen=self.WINDOW)
+            samples.append(ms)
+            if self._trace is not None:
+                self._trace.writerow([f"{time.perf_counter() - self._start:.4f}", self.name, "stage", stage,
+                                      f"{ms:.3f}"])
+
+    def frame_done(self, count=1):
+        with self._lock:
+            self._frames += count
+
+    def snapshot(self):
+        """返回 {fps, stages: {阶段: (p50, p95, p99)}, gauges, rss_mb}，同时把汇总写入追踪文件"""
+        gauges = {name: getter() for name, getter in self._gauges.items()}
+        rss = process_rss_mb()
+        now = time.perf_counter()
+        with self._lock:
+            fps = (self._frames - self._last_frames) / max(now - self._last_time, 1e-6)
+            self._last_frames, self._last_time = self._frames, now
+            stages = {stage: tuple(np.percentile(samples, (50, 95, 99)))
+                      for stage, samples in self._samples.items() if samples}
+            if self._trace is not None:
+                t = f"{now - self._start:.4f}"
+                rows = [("fps", f"{fps:.2f}")] + [(name, value) for name, value in gauges.items()]
+                if rss is not None:
+                    rows.append(("rss_mb", f"{rss:.1f}"))
+                self._trace.writerows([t, self.name, "gauge", name, value] for name, value in rows)
+                self._trace_file.flush()
+        return {"fps": fps, "stages": stages, "gauges": gauges, "rss_mb": rss}
+
+    def close(self):
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = self._trace = None
+
+
+# 统计面板中各阶段和计数的显示名
+STAGE_NAMES = {"decode": "解码", "infer": "推理", "render": "绘制", "encode": "编码", "display": "显示",
+               "latency": "端到端"}
+GAUGE_NAMES = {"imgsz": "输入尺寸", "batch": "合批", "decode_queue": "解码队列", "infer_queue": "推理队列", "render_queue": "绘制队列",
+               "encode_queue": "编码队列", "dropped": "丢帧", "capture_dropped": "采集丢帧",
+               "display_dropped": "显示丢帧", "prefetched": "已预取"}
+
+
+class ModelLoaderThread(QThread):
+    """后台导入 ultralytics/torch、加载并预热模型，主窗口不必等待"""
+    loaded = pyqtSignal(object, str, str, dict)  # 模型, 后端, 模型哈希, 各步骤耗时（秒）
+    failed = pyqtSignal(str)
+
+    def __init__(self, model_path, backend, refine_path=None):
+        super().__init__()
+        self.model_path = model_path
+        self.backend = backend
+        self.refine_path = refine_path  # 级联模式下负责复核的大模型
+
+    def run(self):
+        timings = {}
+        try:
+            start = time.perf_counter()
+            import ultralytics  # noqa: F401  首次导入会连带导入 torch
+            timings["import"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            model = Detector.load(self.model_path, self.backend)
+            # 不同后端的输出略有差异，缓存键区分后端；单文件产物（ONNX/INT8）按实际加载的文件计算哈希，
+            # 重新量化或重新导出后不会误用旧缓存。OpenVINO 产物是目录，仍按 best.pt 计算
+            artifact = backend_artifact(self.model_path, self.backend)
+            weights = artifact if os.path.isfile(artifact) else self.model_path
+            model_hash = f"{file_hash(weights)}-{self.backend}"
+            if self.refine_path:
+                # 量化模型只有 best.pt 的版本，大模型此时用 PyTorch
+                refine_backend = self.backend if BACKENDS[self.backend][1] else "pytorch"
+                model = CascadeDetector(model, Detector.load(self.refine_path, refine_backend))
+                model_hash += f"-cascade-{file_hash(self.refine_path)}"
+            timings["load"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            model.warmup()
+            timings["warmup"] = time.perf_counter() - start
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(model, self.backend, model_hash, timings)
 
 
 # --- MD3 风格配置 ---
@@ -184,21 +1026,50 @@ class MD3Styles:
 
 
 class VideoThread(QThread):
-    """视频处理线程"""
-    frame_processed = pyqtSignal(np.ndarray, int, int)
+    """视频处理线程：解码、推理、绘制、编码分阶段并行，阶段之间用有界队列衔接"""
+    progress_updated = pyqtSignal(int, int, float, int)  # 当前帧, 总帧数, 处理速度(帧/秒), 丢帧数
     finished = pyqtSignal()
 
-    def __init__(self, video_path, model, save_video=False, conf_threshold=0.4, output_dir="output"):
+    MODE_PLAYBACK = "playback"  # 按视频帧率播放，落后时不丢帧
+    MODE_REALTIME = "realtime"  # 与真实时间同步，落后时丢帧
+    MODE_EXPORT = "export"  # 极速导出：不控制播放节奏，只间隔预览
+    QUEUE_SIZE = 4  # 每个阶段之间最多缓冲的帧数，限制内存占用
+    PREVIEW_INTERVAL = 0.5  # 进度刷新间隔（秒），极速导出时也是预览间隔
+
+    def __init__(self, video_path, model, save_video=False, conf_threshold=0.4, output_dir="output",
+                 mode=MODE_PLAYBACK, detect_interval=1, stats=None, batch_size=1, roi=None):
         super().__init__()
         self.video_path = video_path
+        self.roi = roi  # 检测区域，None 表示整幅画面
+        self.batch_size = max(1, batch_size)  # 极速导出时每次前向推理的帧数
+        self.stats = stats or PipelineStats("video")
         self.model = model
-        self.save_video = save_video
+        self.mode = mode
+        self.tracker = KeyframeTracker(detect_interval)
+        # 极速导出的目的就是导出视频，总是写文件
+        self.save_video = save_video or mode == self.MODE_EXPORT
         self.conf_threshold = conf_threshold
         self.output_dir = output_dir
         self.running = True
         self.current_frame = None
         self._pause = False
         self.video_writer = None  # 视频写入器
+        self.last_detection = None  # 当前显示帧的原图和原始检测框
+        self.mailbox = FrameMailbox()  # 界面按刷新率从这里取帧：(标注帧, 当前帧, 总帧数)
+        self._fps = 25.0
+        self._clock_start = None  # 播放时钟：第 0 帧应显示的时刻
+        self.decode_dropped = 0  # 已过显示时间、只抓取不解码的帧数
+        self.infer_dropped = 0  # 解码后已过时、跳过推理的帧数
+
+    @property
+    def dropped_frames(self):
+        return self.decode_dropped + self.infer_dropped
+
+    def _lateness(self, index):
+        """该帧相对播放时钟的延迟（秒），时钟未启动时为 0"""
+        if self._clock_start is None:
+            return 0.0
+        return time.perf_counter() - (self._clock_start + index / self._fps)
 
     def run(self):
         cap = cv2.VideoCapture(self.video_path)
@@ -208,10 +1079,12 @@ class VideoThread(QThread):
 
         # 获取视频属性
         fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps <= 0:
+            fps = 25.0  # 默认帧率
+        self._fps = fps
         frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        current_frame = 0
 
         # 如果启用了保存视频，初始化视频写入器
         if self.save_video:
@@ -229,41 +1102,219 @@ class VideoThread(QThread):
 
             print(f"视频保存路径: {output_path}")
 
-        while self.running and current_frame < frame_count:
-            if self._pause:
-                self.msleep(100)
+        # 实时模式下解码只领先一帧，避免排队的帧在推理前就已过时；合批时至少能缓冲一批
+        if self.mode == self.MODE_REALTIME:
+            decode_queue = queue.Queue(1)
+        else:
+            decode_queue = queue.Queue(max(self.QUEUE_SIZE, self.batch_size))
+        infer_queue = queue.Queue(self.QUEUE_SIZE)
+        render_queue = queue.Queue(self.QUEUE_SIZE)
+        encode_queue = queue.Queue(self.QUEUE_SIZE)
+        for name, q in (("decode_queue", decode_queue), ("infer_queue", infer_queue),
+                        ("render_queue", render_queue), ("encode_queue", encode_queue)):
+            self.stats.add_gauge(name, q.qsize)
+        self.stats.add_gauge("dropped", lambda: self.dropped_frames)
+        self.stats.add_gauge("display_dropped", lambda: self.mailbox.dropped)
+        stages = [
+            threading.Thread(target=self._decode_stage, args=(cap, frame_count, decode_queue), daemon=True),
+            threading.Thread(target=self._infer_stage, args=(decode_queue, infer_queue), daemon=True),
+            threading.Thread(target=self._render_stage, args=(infer_queue, render_queue), daemon=True),
+        ]
+        if self.video_writer is not None:
+            stages.append(threading.Thread(target=self._encode_stage, args=(encode_queue,), daemon=True))
+        for stage in stages:
+            stage.start()
+
+        # 当前线程负责把绘制好的帧送去显示和编码，播放模式下按时钟控制节奏
+        export = self.mode == self.MODE_EXPORT
+        last_report = time.perf_counter()
+        reported = 0
+        last_index, last_annotated = -1, None
+        while True:
+            if self._pause and self.running:
+                pause_start = time.perf_counter()
+                while self._pause and self.running:
+                    self.msleep(100)
+                # 暂停时间不计入播放时钟和处理速度
+                if self._clock_start is not None:
+                    self._clock_start += time.perf_counter() - pause_start
+                last_report = time.perf_counter()
                 continue
 
-            ret, frame = cap.read()
-            if not ret:
+            item = self._get(render_queue)
+            if item is None:
                 break
+            index, frame, dets, annotated_frame = item
+            self.last_detection = (frame, dets)
+            self.current_frame = annotated_frame
+            self.stats.frame_done()
+
+            if self.video_writer is not None:
+                # 实时模式丢掉的帧用上一帧补齐，保证导出视频的时长不变
+                if last_annotated is not None:
+                    for _ in range(index - last_index - 1):
+                        self._put(encode_queue, last_annotated)
+                self._put(encode_queue, annotated_frame)
+            last_index, last_annotated = index, annotated_frame
+
+            now = time.perf_counter()
+            report = now - last_report >= self.PREVIEW_INTERVAL
+            if report:
+                self.progress_updated.emit(index + 1, frame_count, (index + 1 - reported) / (now - last_report),
+                                           self.dropped_frames)
+                last_report, reported = now, index + 1
+
+            if export:
+                if report:
+                    self.mailbox.post(annotated_frame, index, frame_count)
+                continue
+
+            # 按播放时钟等待到该帧的显示时刻，而不是固定休眠
+            if self._clock_start is None:
+                self._clock_start = now - index / fps
+            lateness = self._lateness(index)
+            if lateness < 0:
+                self.msleep(int(-lateness * 1000))
+            elif self.mode == self.MODE_PLAYBACK:
+                # 逐帧模式落后时把时钟对齐到当前帧，不丢帧也不事后追赶
+                self._clock_start += lateness
+            self.mailbox.post(annotated_frame, index, frame_count)
+
+        # 通知编码阶段收尾，等待所有阶段退出
+        self._put(encode_queue, None)
+        for stage in stages:
+            stage.join()
+
+        # 释放资源
+        cap.release()
+        if self.video_writer is not None:
+            self.video_writer.release()
+            print("视频写入器已释放")
+
+        self.finished.emit()
 
+    def _put(self, q, item):
+        """放入队列；队列满时等待，线程停止时放弃"""
+        while self.running:
             try:
-                results = self.model(frame, conf=self.conf_threshold)
-                annotated_frame = results[0].plot()
-                self.current_frame = annotated_frame.copy()
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
-                # 如果启用了保存视频，将处理后的帧写入文件
-                if self.save_video and self.video_writer is not None:
-                    self.video_writer.write(annotated_frame)
+    def _get(self, q):
+        """取出队列元素；线程停止或收到结束标记时返回 None"""
+        while self.running:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return None
 
-                self.frame_processed.emit(annotated_frame, current_frame, frame_count)
-                current_frame += 1
+    def _decode_stage(self, cap, frame_count, out_queue):
+        realtime = self.mode == self.MODE_REALTIME
+        index = 0
+        while self.running and (frame_count <= 0 or index < frame_count):
+            if self._pause:
+                time.sleep(0.1)
+                continue
+            if realtime and self._lateness(index) > 0:
+                # 已经错过显示时间的帧只抓取、不解码
+                if not cap.grab():
+                    break
+                self.decode_dropped += 1
+                index += 1
+                continue
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                break
+            self.stats.record("decode", time.perf_counter() - start)
+            if not self._put(out_queue, (index, frame)):
+                return
+            index += 1
+        self._put(out_queue, None)
+
+    def _infer_stage(self, in_queue, out_queue):
+        realtime = self.mode == self.MODE_REALTIME
+        ended = False
+        while not ended:
+            item = self._get(in_queue)
+            if item is None:
+                break
+            index, frame = item
+            # 已落后一帧以上且后面还有新帧时，跳过这一帧的推理
+            if realtime and not self._pause and not in_queue.empty() and self._lateness(index) > 1 / self._fps:
+                self.infer_dropped += 1
+                continue
 
-                delay = max(1, int(1000 / fps) - 10)
-                self.msleep(delay)
+            # 只有极速导出且逐帧检测时合批，其余模式合批会增加显示延迟，跟踪器也要求逐帧处理
+            batch_size = self.batch_size if self.mode == self.MODE_EXPORT and self.tracker.interval <= 1 else 1
+            batch = [item]
+            while len(batch) < batch_size:
+                item = self._get(in_queue)
+                if item is None:
+                    ended = True
+                    break
+                batch.append(item)
 
+            try:
+                start = time.perf_counter()
+                dets_list = self.detect_batch([frame for _, frame in batch])
+                elapsed = (time.perf_counter() - start) / len(batch)
+                for _ in batch:
+                    self.stats.record("infer", elapsed)
             except Exception as e:
                 print(f"视频处理错误: {e}")
+                self.running = False
+                return
+            # 按帧序拆回单帧，后续绘制和编码不感知合批
+            for (index, frame), dets in zip(batch, dets_list):
+                if not self._put(out_queue, (index, frame, dets)):
+                    return
+        self._put(out_queue, None)
+
+    def detect_batch(self, frames):
+        """多帧合成一批前向推理，返回与 frames 一一对应的检测框列表"""
+        if len(frames) == 1:
+            return [self.detect(frames[0])]
+        return run_detection(self.model, frames, [self.roi] * len(frames))
+
+    def detect(self, frame):
+        """关键帧运行模型，其余帧由跟踪器推算检测框"""
+        if self.tracker.need_detection():
+            dets = run_detection(self.model, [frame], [self.roi])[0]
+            return self.tracker.update_detections(frame, dets)
+        return self.tracker.track(frame)
+
+    def _render_stage(self, in_queue, out_queue):
+        while True:
+            item = self._get(in_queue)
+            if item is None:
                 break
+            index, frame, dets = item
+            try:
+                start = time.perf_counter()
+                annotated_frame = render_detections(frame, filter_detections(dets, self.conf_threshold),
+                                                    self.model.names)
+                self.stats.record("render", time.perf_counter() - start)
+            except Exception as e:
+                print(f"视频处理错误: {e}")
+                self.running = False
+                return
+            if not self._put(out_queue, (index, frame, dets, annotated_frame)):
+                return
+        self._put(out_queue, None)
 
-        # 释放资源
-        cap.release()
-        if self.video_writer is not None:
-            self.video_writer.release()
-            print("视频写入器已释放")
-
-        self.finished.emit()
+    def _encode_stage(self, in_queue):
+        while True:
+            frame = self._get(in_queue)
+            if frame is None:
+                break
+            start = time.perf_counter()
+            self.video_writer.write(frame)
+            self.stats.record("encode", time.perf_counter() - start)
 
     def stop(self):
         self.running = False
@@ -274,88 +1325,592 @@ class VideoThread(QThread):
     def resume(self):
         self._pause = False
 
+    def render_last(self, conf_threshold):
+        """按新阈值重新绘制最近一帧（暂停时调整阈值用）"""
+        if self.last_detection is None:
+            return None
+        frame, dets = self.last_detection
+        return render_detections(frame, filter_detections(dets, conf_threshold), self.model.names)
+
+
+class LatestFrameGrabber(threading.Thread):
+    """采集线程：持续读取摄像头并只保留最新一帧，避免帧积压在驱动缓冲区里
+
+    多路摄像头共用同一个 Condition，推理循环可以等待任意一路出现新帧。
+    """
+
+    def __init__(self, cap, cond=None):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.running = True
+        self.failed = False
+        self.dropped = 0  # 未被取走就被新帧覆盖的帧数
+        self._cond = cond or threading.Condition()
+        self._frame = None
+        self._captured_at = 0.0
+
+    @property
+    def has_frame(self):
+        return self._frame is not None
+
+    def run(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            captured_at = time.perf_counter()
+            with self._cond:
+                if not ret:
+                    self.failed = True
+                    self._cond.notify_all()
+                    break
+                if self._frame is not None:
+                    self.dropped += 1
+                self._frame, self._captured_at = frame, captured_at
+                self._cond.notify_all()
+
+    def latest(self, timeout=1.0):
+        """取走最新一帧，返回 (帧, 采集时刻)；暂时没有新帧时返回 (None, 0)"""
+        with self._cond:
+            if self._frame is None and self.running and not self.failed and timeout > 0:
+                self._cond.wait(timeout)
+            frame, captured_at = self._frame, self._captured_at
+            self._frame = None
+            return frame, captured_at
+
+    def stop(self):
+        self.running = False
+
+
+def parse_camera_sources(text):
+    """解析逗号分隔的摄像头列表：纯数字为设备编号，其余按视频流地址处理"""
+    sources = []
+    for item in text.split(','):
+        item = item.strip()
+        if item:
+            sources.append(int(item) if item.isdigit() else item)
+    return sources or [0]
+
+
+def compose_grid(frames, labels=None, tile_width=640):
+    """把多路画面按网格拼接成一幅图，各路按比例缩放到相同大小的格子里"""
+    if len(frames) == 1:
+        return frames[0]
+    cols = int(np.ceil(np.sqrt(len(frames))))
+    rows = int(np.ceil(len(frames) / cols))
+    tile_height = tile_width * 9 // 16
+    canvas = np.zeros((rows * tile_height, cols * tile_width, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        row, col = divmod(i, cols)
+        cell = canvas[row * tile_height:(row + 1) * tile_height, col * tile_width:(col + 1) * tile_width]
+        if frame is not None:
+            h, w = frame.shape[:2]
+            scale = min(tile_width / w, tile_height / h)
+            size = (max(1, int(w * scale)), max(1, int(h * scale)))
+            left, top = (tile_width - size[0]) // 2, (tile_height - size[1]) // 2
+            cell[top:top + size[1], left:left + size[0]] = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if labels:
+            cv2.putText(cell, labels[i], (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    return canvas
+
+
+class EventRecorder:
+    """事件录像：内存中保留最近 pre_roll 秒的画面，检测到目标时连同这段预录一起写入新片段，
+    连续 quiet 秒没有目标后结束片段，并在 clips.csv 中追加一条索引。
+
+    待命时的预录帧以 JPEG 压缩保存，720p 下几秒的预录只占十几 MB 内存。
+    推理循环通常比摄像头帧率慢，预录按时间而不是帧数截取，片段也按实际送入的帧率写入，播放速度才正确。
+    """
+
+    INDEX_FIELDS = ["file", "camera", "start", "end", "duration_s", "frames", "max_count"]
+
+    RATE_WINDOW = 30  # 按最近若干帧的送入时间估计实际帧率
+
+    def __init__(self, output_dir, camera, fps, pre_roll=5.0, quiet=3.0):
+        self.output_dir = output_dir
+        self.camera = camera
+        self.fps = fps  # 摄像头标称帧率，只在还测不出实际帧率时使用
+        self.pre_roll = pre_roll
+        self.quiet = quiet
+        # 送入速度不会超过采集速度，按标称帧率设上限，防止时间戳异常时无限增长
+        self._buffer = deque(maxlen=max(1, int(pre_roll * fps) + 1))  # (时间, JPEG 数据)
+        self._push_times = deque(maxlen=self.RATE_WINDOW)
+        self._writer = None
+        self._clip = None  # 当前片段的信息，写入索引用
+        self._last_seen = 0.0
+        self.clips = 0  # 已完成的片段数
+
+    @property
+    def recording(self):
+        return self._writer is not None
+
+    @property
+    def rate(self):
+        """实际送入帧率；样本不足时退回标称帧率"""
+        if len(self._push_times) < 2:
+            return self.fps
+        span = self._push_times[-1] - self._push_times[0]
+        if span <= 0:
+            return self.fps
+        return min(self.fps, (len(self._push_times) - 1) / span)
+
+    def push(self, frame, count):
+        """送入一帧标注画面及其目标数"""
+        now = time.time()
+        self._push_times.append(now)
+        if self._writer is None:
+            # 丢掉超出预录时长的旧帧
+            while self._buffer and now - self._buffer[0][0] > self.pre_roll:
+                self._buffer.popleft()
+            if count > 0:
+                self._open(frame, now)
+            else:
+                ok, data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
+                if ok:
+                    self._buffer.append((now, data))
+                return
+
+        self._writer.write(frame)
+        self._clip["frames"] += 1
+        if count > 0:
+            self._last_seen = now
+            self._clip["max_count"] = max(self._clip["max_count"], count)
+        elif now - self._last_seen >= self.quiet:
+            self.close()
+
+    def _open(self, frame, now):
+        os.makedirs(self.output_dir, exist_ok=True)
+        start = self._buffer[0][0] if self._buffer else now
+        name = f"event_{self.camera}_{time.strftime('%Y%m%d_%H%M%S', time.localtime(start))}.mp4"
+        path = os.path.join(self.output_dir, name)
+        h, w = frame.shape[:2]
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), self.rate, (w, h))
+        frames = 0
+        # 先写入预录，再写触发帧
+        for _, data in self._buffer:
+            buffered = cv2.imdecode(data, cv2.IMREAD_COLOR)
+            if buffered is not None and buffered.shape[:2] == (h, w):
+                self._writer.write(buffered)
+                frames += 1
+        self._buffer.clear()
+        self._clip = {"file": name, "camera": self.camera, "start": start, "frames": frames, "max_count": 0}
+        self._last_seen = now
+        print(f"检测到目标，开始录制事件片段: {path}")
+
+    def close(self):
+        """结束当前片段（如果有）并写入索引"""
+        if self._writer is None:
+            return
+        self._writer.release()
+        self._writer = None
+        end = time.time()
+        clip = self._clip
+        row = dict(clip, end=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(end)),
+                   start=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(clip["start"])),
+                   duration_s=round(end - clip["start"], 1))
+        index_path = os.path.join(self.output_dir, "clips.csv")
+        try:
+            new_file = not os.path.exists(index_path)
+            with open(index_path, "a", newline="", encoding="utf-8-sig") as f:
+                writer = csv.DictWriter(f, fieldnames=self.INDEX_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(row)
+        except OSError as e:
+            print(f"写入片段索引失败: {e}")
+        self.clips += 1
+        print(f"事件片段结束: {clip['file']}，时长 {row['duration_s']} 秒")
+
+
+class CameraStream:
+    """多路监控中的一路摄像头：采集、跟踪、运动门控和录像各自独立，模型由所有路共用"""
+
+    def __init__(self, source, detect_interval=1, motion_threshold=0.0, roi=None):
+        self.source = source
+        self.label = f"CAM {source}"
+        self.roi = roi  # 检测区域，None 表示整幅画面
+        self.frame = None  # 最近一帧原始画面，绘制检测区域时使用
+        self.cap = None
+        self.grabber = None
+        self.fps = 20.0
+        self.tracker = KeyframeTracker(detect_interval)
+        self.motion_gate = MotionGate(motion_threshold)
+        self.last_dets = np.zeros((0, 6), dtype=np.float32)
+        self.annotated = None  # 最近一帧标注画面，拼接网格时使用
+        self.count = 0  # 最近一帧阈值以上的目标数
+        self.video_writer = None
+        self.recorder = None  # 事件录像模式下的 EventRecorder
+
+    def open(self, cond):
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            return False
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 部分后端支持，减少驱动缓冲的旧帧
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if fps > 0:
+            self.fps = fps
+        self.grabber = LatestFrameGrabber(self.cap, cond)
+        self.grabber.start()
+        return True
+
+    @property
+    def alive(self):
+        return self.grabber is not None and not self.grabber.failed
+
+    def close(self):
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber.join()
+        if self.cap is not None:
+            self.cap.release()
+        if self.video_writer is not None:
+            self.video_writer.release()
+            self.video_writer = None
+        if self.recorder is not None:
+            self.recorder.close()
+
 
 class CameraThread(QThread):
-    """摄像头线程"""
-    frame_processed = pyqtSignal(np.ndarray)
+    """摄像头线程：支持多路摄像头，每路在独立线程中采集，推理循环把各路的最新帧合成一批送入模型"""
 
-    def __init__(self, camera_id, model, conf_threshold=0.4, save_video=False, output_dir="output"):
+    def __init__(self, sources, model, conf_threshold=0.4, save_video=False, output_dir="output",
+                 detect_interval=1, motion_threshold=0.0, stats=None, latency_budget=0.0, rois=None,
+                 event_record=None):
         super().__init__()
-        self.camera_id = camera_id
+        if not isinstance(sources, (list, tuple)):
+            sources = [sources]
+        rois = rois or {}
+        self.streams = [CameraStream(source, detect_interval, motion_threshold, rois.get(source))
+                        for source in sources]
         self.model = model
+        self.stats = stats or PipelineStats("camera")
         self.conf_threshold = conf_threshold
         self.save_video = save_video
         self.output_dir = output_dir
+        self.event_record = event_record  # (预录秒数, 静默秒数)，设置后只在发现目标时录制
         self.running = True
-        self.video_writer = None
         self.recording_start_time = None
+        self.last_batch = 0  # 最近一次合批推理的帧数
+        self.latency = LatencyController(latency_budget)
+        self.mailbox = FrameMailbox()  # 界面按刷新率从这里取帧：(标注帧或拼接画面, 采集时刻)
+        self._cond = threading.Condition()  # 所有采集线程共用，任意一路有新帧就唤醒推理循环
+
+    def set_detect_interval(self, interval):
+        for stream in self.streams:
+            stream.tracker.interval = interval
+
+    def set_motion_threshold(self, threshold):
+        for stream in self.streams:
+            stream.motion_gate.threshold = threshold
+
+    @property
+    def motion_threshold(self):
+        return self.streams[0].motion_gate.threshold
+
+    @property
+    def event_clips(self):
+        """已保存的事件片段数，以及是否有片段正在录制"""
+        recorders = [s.recorder for s in self.streams if s.recorder is not None]
+        return sum(r.clips for r in recorders), any(r.recording for r in recorders)
+
+    def gate_stats(self):
+        """各路运动门控合计的 (跳过帧数, 总帧数)"""
+        return (sum(s.motion_gate.skipped_frames for s in self.streams),
+                sum(s.motion_gate.total_frames for s in self.streams))
 
     def run(self):
-        cap = cv2.VideoCapture(self.camera_id)
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        streams = []
+        for stream in self.streams:
+            if stream.open(self._cond):
+                streams.append(stream)
+            else:
+                print(f"无法打开摄像头: {stream.source}")
+        if not streams:
+            return
 
-        # 获取摄像头帧率和尺寸
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps <= 0:
-            fps = 20.0  # 默认帧率
+        # 出错时也要释放所有摄像头和录像，否则设备在程序重启前无法再次打开
+        try:
+            self._loop(streams)
+        except Exception as e:
+            print(f"摄像头处理错误: {e}")
+            self.running = False
+        finally:
+            for stream in streams:
+                stream.close()
 
-        # 初始化视频写入器（如果需要录制）
+    def _loop(self, streams):
+        # 初始化视频写入器（如果需要录制）；事件录像按路各建一个录制器
         if self.save_video:
-            self.initialize_video_writer(cap, fps)
+            for stream in streams:
+                if self.event_record:
+                    stream.recorder = EventRecorder(os.path.join(self.output_dir, "events"),
+                                                    f"cam{self.streams.index(stream)}", stream.fps,
+                                                    *self.event_record)
+                else:
+                    self.initialize_video_writer(stream)
+
+        self.stats.add_gauge("batch", lambda: self.last_batch)
+        self.stats.add_gauge("imgsz", lambda: self.latency.imgsz if self.latency.budget_ms > 0 else "默认")
+        self.stats.add_gauge("capture_dropped", lambda: sum(s.grabber.dropped for s in streams))
+        self.stats.add_gauge("display_dropped", lambda: self.mailbox.dropped)
+        labels = [stream.label for stream in self.streams]
 
         while self.running:
-            ret, frame = cap.read()
-            if not ret:
-                break
+            with self._cond:
+                self._cond.wait_for(lambda: not self.running or any(s.grabber.has_frame for s in streams)
+                                    or not any(s.alive for s in streams), timeout=1.0)
+            fresh = []
+            for stream in streams:
+                frame, captured_at = stream.grabber.latest(timeout=0)
+                if frame is not None:
+                    fresh.append((stream, frame, captured_at))
+            if not fresh:
+                if not any(s.alive for s in streams):
+                    break
+                continue
 
-            results = self.model(frame, conf=self.conf_threshold)
-            annotated_frame = results[0].plot()
+            start = time.perf_counter()
+            self.detect(fresh)
+            rendered = time.perf_counter()
+            for stream, frame, _ in fresh:
+                shown = filter_detections(stream.last_dets, self.conf_threshold)
+                stream.annotated = render_detections(frame, shown, self.model.names)
+                stream.count = len(shown)
+            self.stats.record("infer", rendered - start)
+            self.stats.record("render", time.perf_counter() - rendered)
+            # 只用真正运行了模型的帧调整输入尺寸，跳过推理的帧耗时不能代表模型开销
+            if self.last_batch:
+                self.latency.update((time.perf_counter() - start) * 1000)
 
             # 如果启用了录制，写入帧
-            if self.save_video and self.video_writer is not None:
-                self.video_writer.write(annotated_frame)
-
-            self.frame_processed.emit(annotated_frame)
+            if self.save_video:
+                start = time.perf_counter()
+                for stream, _, _ in fresh:
+                    if stream.recorder is not None:
+                        stream.recorder.push(stream.annotated, stream.count)
+                    elif stream.video_writer is not None:
+                        stream.video_writer.write(stream.annotated)
+                self.stats.record("encode", time.perf_counter() - start)
+
+            # 多路时拼成网格画面；延迟按本批最早采集的一帧计算
+            frame = compose_grid([s.annotated for s in self.streams], labels)
+            self.mailbox.post(frame, min(captured_at for _, _, captured_at in fresh))
+            self.stats.frame_done(len(fresh))
+
+    def detect(self, fresh):
+        """各路分别经过运动门控和跟踪器，需要检测的帧合成一批，一次前向推理"""
+        batch = []
+        for stream, frame, _ in fresh:
+            stream.frame = frame
+            # 画面静止时复用上次结果；非关键帧由跟踪器推算检测框。门控只看检测区域内的变化
+            gate_view = stream.roi.crop(frame)[0] if stream.roi else frame
+            if not stream.motion_gate.should_infer(gate_view):
+                continue
+            if stream.tracker.need_detection():
+                batch.append((stream, frame))
+            else:
+                stream.last_dets = stream.tracker.track(frame)
 
-        # 释放资源
-        cap.release()
-        if self.video_writer is not None:
-            self.video_writer.release()
+        self.last_batch = len(batch)
+        if batch:
+            dets_list = run_detection(self.model, [frame for _, frame in batch], [stream.roi for stream, _ in batch],
+                                      **self.latency.infer_kwargs())
+            for (stream, frame), dets in zip(batch, dets_list):
+                stream.last_dets = stream.tracker.update_detections(frame, dets)
 
-    def initialize_video_writer(self, cap, fps):
+    def initialize_video_writer(self, stream):
         """初始化视频写入器"""
         try:
             # 确保输出目录存在
             os.makedirs(self.output_dir, exist_ok=True)
 
             # 获取帧尺寸
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            width = int(stream.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(stream.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
-            # 生成输出文件名
+            # 生成输出文件名，多路时按摄像头区分
             timestamp = int(time.time())
-            output_path = os.path.join(self.output_dir, f"camera_recording_{timestamp}.mp4")
+            suffix = "" if len(self.streams) == 1 else f"_cam{self.streams.index(stream)}"
+            output_path = os.path.join(self.output_dir, f"camera_recording_{timestamp}{suffix}.mp4")
 
             # 初始化视频写入器
             fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # 或者 'XVID' for AVI
-            self.video_writer = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+            stream.video_writer = cv2.VideoWriter(output_path, fourcc, stream.fps, (width, height))
 
             self.recording_start_time = time.time()
             print(f"开始录制摄像头视频: {output_path}")
 
         except Exception as e:
             print(f"初始化视频写入器失败: {e}")
-            self.video_writer = None
+            stream.video_writer = None
 
     def stop(self):
         self.running = False
-        if self.video_writer is not None:
-            self.video_writer.release()
+        with self._cond:
+            self._cond.notify_all()
+        if self.recording_start_time is not None:
             recording_duration = time.time() - self.recording_start_time
             print(f"录制结束，时长: {recording_duration:.1f}秒")
 
 
+class ImageDetectThread(QThread):
+    """图片检测线程：优先检测当前图片，空闲时预取并预检测前后相邻的图片"""
+    result_ready = pyqtSignal(int, object)
+    detection_failed = pyqtSignal(int, str)
+
+    def __init__(self, model, prefetch=3, cache=None, model_hash="", stats=None):
+        super().__init__()
+        self.model = model
+        self.stats = stats or PipelineStats("image")
+        self.prefetch = prefetch  # 光标前后各预取的图片数，用于限制内存占用
+        self.cache = cache  # 磁盘缓存，已分析过的图片跳过推理
+        self.model_hash = model_hash
+        self.running = True
+        self._cond = threading.Condition()
+        self.image_files = []
+        self.conf_threshold = 0.4
+        self.cursor = -1
+        self._wanted = None  # 界面正在等待结果的图片序号
+        self._cache = {}  # 图片序号 -> 检测结果，只保留窗口内的图片
+        self._failed = set()
+        self.tiled = False  # 高分辨率图片使用分块推理
+        self.stats.add_gauge("prefetched", lambda: len(self._cache))
+
+    def set_files(self, image_files):
+        with self._cond:
+            self.image_files = list(image_files)
+            self.cursor = -1
+            self._wanted = None
+            self._cache.clear()
+            self._failed.clear()
+
+    def set_tiled(self, tiled):
+        """切换分块推理，已预取的结果作废"""
+        with self._cond:
+            if tiled != self.tiled:
+                self.tiled = tiled
+                self._cache.clear()
+                self._failed.clear()
+                self._cond.notify()
+
+    def request(self, index, conf_threshold):
+        """把光标移到 index：已缓存则直接返回结果，否则返回 None，完成后发出 result_ready"""
+        with self._cond:
+            # 缓存的是最低阈值下的原始检测框，阈值变化不影响缓存，只用于预先绘制
+            self.conf_threshold = conf_threshold
+            self.cursor = index
+            lo, hi = self._window()
+            for i in [i for i in self._cache if not lo <= i <= hi]:
+                del self._cache[i]
+            self._failed.discard(index)  # 当前图片失败时允许重试
+
+            entry = self._cache.get(index)
+            # 新请求直接取代旧请求，快速翻页时不会堆积过期推理
+            self._wanted = None if entry is not None else index
+            self._cond.notify()
+            return entry
+
+    def is_cached(self, index):
+        """index 的结果是否已预取在内存中"""
+        with self._cond:
+            return index in self._cache
+
+    def _window(self):
+        return self.cursor - self.prefetch, self.cursor + self.prefetch
+
+    def _next_job(self):
+        """当前图片优先，其余按离光标由近到远（先后后前）预取"""
+        if self.cursor < 0:
+            return None
+        offsets = [0] + [d for k in range(1, self.prefetch + 1) for d in (k, -k)]
+        for offset in offsets:
+            i = self.cursor + offset
+            if 0 <= i < len(self.image_files) and i not in self._cache and i not in self._failed:
+                return i
+        return None
+
+    def run(self):
+        while True:
+            with self._cond:
+                job = None
+                while self.running:
+                    job = self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if not self.running:
+                    break
+                files = self.image_files
+                conf_threshold = self.conf_threshold
+                tiled = self.tiled
+
+            entry, error = self._detect(files[job], conf_threshold, tiled)
+
+            with self._cond:
+                # 处理期间换了图片列表或推理方式，结果作废
+                if files is not self.image_files or tiled != self.tiled:
+                    continue
+                lo, hi = self._window()
+                if error:
+                    self._failed.add(job)
+                elif lo <= job <= hi:
+                    self._cache[job] = entry
+                wanted = self._wanted == job
+                if wanted:
+                    self._wanted = None
+
+            if wanted:
+                if error:
+                    self.detection_failed.emit(job, error)
+                else:
+                    self.result_ready.emit(job, entry)
+
+    def _detect(self, path, conf_threshold, tiled=False):
+        """解码并检测单张图片，返回 (结果, 错误信息)"""
+        start = time.perf_counter()
+        image = read_image(path)
+        if image is None:
+            return None, f"读取失败: {os.path.basename(path)}"
+        self.stats.record("decode", time.perf_counter() - start)
+        try:
+            dets, key = None, None
+            if self.cache is not None and self.model_hash:
+                params = {"conf": CONF_FLOOR}
+                if tiled:
+                    params["tiled"] = 1
+                key = DetectionCache.make_key(file_hash(path), self.model_hash, **params)
+                dets = self.cache.get(key)
+            if dets is None:
+                start = time.perf_counter()
+                if tiled:
+                    dets = tiled_detect(self.model, image)
+                else:
+                    dets = extract_detections(self.model(image, conf=CONF_FLOOR, verbose=False)[0])
+                self.stats.record("infer", time.perf_counter() - start)
+                if key is not None:
+                    self.cache.put(key, dets)
+            shown = filter_detections(dets, conf_threshold)
+            start = time.perf_counter()
+            annotated = render_detections(image, shown, self.model.names)
+            self.stats.record("render", time.perf_counter() - start)
+            self.stats.frame_done()
+            return {
+                "image": image,
+                "dets": dets,
+                "conf": conf_threshold,
+                "annotated": annotated,
+                "count": len(shown),
+            }, None
+        except Exception as e:
+            print(f"图片检测错误: {e}")
+            return None, str(e)
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+
+
 class StyledButton(QPushButton):
     """MD3 风格按钮"""
 
@@ -441,6 +1996,82 @@ class ClassDetailDialog(QMessageBox):
         self.setStandardButtons(QMessageBox.Ok)
 
 
+class RoiCanvas(QWidget):
+    """在一帧画面上用鼠标绘制多边形：左键添加顶点，右键闭合当前多边形"""
+
+    def __init__(self, frame, polygons, max_size=(960, 540), parent=None):
+        super().__init__(parent)
+        qimg, _ = frame_to_qimage(frame, max_size[0], max_size[1])
+        self._pixmap = QPixmap.fromImage(qimg)
+        self.setFixedSize(self._pixmap.size())
+        self.polygons = [[tuple(p) for p in polygon] for polygon in polygons]
+        self.current = []
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.current.append((event.x() / self.width(), event.y() / self.height()))
+        elif event.button() == Qt.RightButton:
+            self.close_polygon()
+        self.update()
+
+    def close_polygon(self):
+        if len(self.current) >= 3:
+            self.polygons.append(self.current)
+        self.current = []
+        self.update()
+
+    def clear(self):
+        self.polygons, self.current = [], []
+        self.update()
+
+    def _points(self, polygon):
+        return [QPointF(x * self.width(), y * self.height()) for x, y in polygon]
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._pixmap)
+        painter.setPen(QPen(QColor(MD3Styles.PRIMARY), 2))
+        painter.setBrush(QColor(0, 200, 120, 60))
+        for polygon in self.polygons:
+            painter.drawPolygon(QPolygonF(self._points(polygon)))
+        if self.current:
+            points = self._points(self.current)
+            painter.setPen(QPen(QColor("#d32f2f"), 2))
+            painter.drawPolyline(QPolygonF(points))
+            for point in points:
+                painter.drawEllipse(point, 3, 3)
+
+
+class RoiEditorDialog(QDialog):
+    """检测区域编辑对话框：在该来源的一帧画面上绘制一个或多个多边形"""
+
+    def __init__(self, frame, polygons, title, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"设置检测区域 - {title}")
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("左键依次点击添加顶点，右键闭合多边形；可绘制多个区域，不设置区域则检测整幅画面。"))
+        self.canvas = RoiCanvas(frame, polygons)
+        layout.addWidget(self.canvas, alignment=Qt.AlignCenter)
+
+        buttons = QHBoxLayout()
+        clear_btn = StyledButton("清除全部", btn_type="Outlined", small=True)
+        clear_btn.clicked.connect(self.canvas.clear)
+        cancel_btn = StyledButton("取消", btn_type="Text", small=True)
+        cancel_btn.clicked.connect(self.reject)
+        save_btn = StyledButton("保存", btn_type="Filled", small=True)
+        save_btn.clicked.connect(self.accept)
+        buttons.addWidget(clear_btn)
+        buttons.addStretch()
+        buttons.addWidget(cancel_btn)
+        buttons.addWidget(save_btn)
+        layout.addLayout(buttons)
+
+    def polygons(self):
+        """保存时未闭合的多边形也一并闭合"""
+        self.canvas.close_polygon()
+        return [[[round(x, 4), round(y, 4)] for x, y in polygon] for polygon in self.canvas.polygons]
+
+
 # --- 页面组件 ---
 
 class MainMenuPage(QWidget):
@@ -509,6 +2140,8 @@ class ImageDetectionPage(QWidget):
         self.image_files = []
         self.current_image_index = 0
         self.current_image_name = ""  # 新增：当前图片文件名
+        self.detect_thread = None
+        self.current_entry = None  # 当前图片的检测结果（含原始检测框）
         self.init_ui()
 
     def init_ui(self):
@@ -536,6 +2169,9 @@ class ImageDetectionPage(QWidget):
         self.detect_btn.clicked.connect(self.detect_images)
         self.detect_btn.setEnabled(False)
 
+        self.tiled_check = QCheckBox("分块检测（高分辨率图片小目标）")
+        self.tiled_check.toggled.connect(self.update_tiled)
+
         action_row = QHBoxLayout()
         self.save_btn = StyledButton("保存结果", btn_type="Outlined", small=True)
         self.save_btn.clicked.connect(self.save_current_result)
@@ -544,6 +2180,7 @@ class ImageDetectionPage(QWidget):
 
         ctrl_layout.addWidget(self.image_btn)
         ctrl_layout.addWidget(self.detect_btn)
+        ctrl_layout.addWidget(self.tiled_check)
         ctrl_layout.addLayout(action_row)
         controls.setLayout(ctrl_layout)
         layout.addWidget(controls)
@@ -578,22 +2215,36 @@ class ImageDetectionPage(QWidget):
         if file_paths:
             self.image_files = file_paths
             self.current_image_index = 0
+            if self.detect_thread is not None:
+                self.detect_thread.set_files(file_paths)
             self.load_current_image()
-            self.detect_btn.setEnabled(True)
+            self.detect_btn.setEnabled(self.parent.model_ready)
             self.prev_btn.setEnabled(len(file_paths) > 1)
             self.next_btn.setEnabled(len(file_paths) > 1)
             self.parent.log_message(f"📁 已选择 {len(file_paths)} 张图片")
+            if self.detect_thread is not None:
+                # 检测线程已在运行时直接分析新的第一张，并开始预取
+                self.detect_images()
 
     def load_current_image(self):
         if self.image_files:
             file_path = self.image_files[self.current_image_index]
+            self.current_image_name = os.path.basename(file_path)  # 保存文件名
+            self.current_entry = None
+            self.save_btn.setEnabled(False)
+            self.detect_btn.setEnabled(self.parent.model_ready)
+            self.detect_btn.setText("开始检测")
+            self.update_display_info()  # 更新显示信息
+
+            # 已预取的图片由检测线程直接给出结果；否则先显示原图，不让上一张的结果留在屏幕上
+            if self.detect_thread is not None and self.detect_thread.is_cached(self.current_image_index):
+                return
             self.current_image = self.parent.read_image(file_path)
             if self.current_image is not None:
-                self.current_image_name = os.path.basename(file_path)  # 保存文件名
+                self.parent.display_owner = self
                 self.parent.display_image(self.current_image)
-                self.update_display_info()  # 更新显示信息
             else:
-                self.parent.log_message(f"❌ 读取失败: {os.path.basename(file_path)}")
+                self.parent.log_message(f"❌ 读取失败: {self.current_image_name}")
 
     def update_display_info(self):
         """更新显示信息（序号和文件名）"""
@@ -607,53 +2258,85 @@ class ImageDetectionPage(QWidget):
                 self.parent.display_caption.setText(f"图片检测: {base_name}")
 
     def detect_images(self):
-        print(f"DEBUG: 开始检测，当前窗口ID: {id(self.parent)}")
-
-        if not hasattr(self, 'parent') or self.parent is None:
-            print("ERROR: 没有找到父窗口!")
-            return
-
         if not self.image_files or self.parent.model is None:
-            print("DEBUG: 条件不满足，直接返回")
             return
 
-        try:
-            self.detect_btn.setEnabled(False)
-            self.detect_btn.setText("分析中...")
-
-            # 更新显示状态
-            base_name = os.path.basename(self.image_files[self.current_image_index])
-            self.status_label.setText(f"分析中: {base_name}")
-
-            QApplication.processEvents()
-
-            print("DEBUG: 开始模型推理 - 准备调用 model()")
-            results = self.parent.model(self.current_image, conf=self.parent.conf_threshold)
-            print("DEBUG: 模型推理完成")
-
-            annotated_frame = results[0].plot()
-            print("DEBUG: 结果绘图完成")
-
-            self.current_result = annotated_frame
-            self.parent.display_image(annotated_frame)
-            self.save_btn.setEnabled(True)
-
-            boxes = results[0].boxes
-            count = len(boxes) if boxes else 0
-            self.parent.update_stats(count, annotated_frame.shape[:2])
-
-            # 更新显示完成状态
-            self.update_display_info()
-            self.parent.log_message(f"🔍 检测完成: {base_name} - 发现 {count} 个目标")
+        # 模型切换后需要重建检测线程
+        if self.detect_thread is None or self.detect_thread.model is not self.parent.model:
+            self.stop_detection()
+            self.detect_thread = ImageDetectThread(self.parent.model, cache=self.parent.detection_cache,
+                                                   model_hash=self.parent.model_hash,
+                                                   stats=self.parent.create_stats("image"))
+            self.detect_thread.set_tiled(self.tiled_check.isChecked())
+            self.detect_thread.result_ready.connect(self.on_detection_result)
+            self.detect_thread.detection_failed.connect(self.on_detection_failed)
+            self.detect_thread.set_files(self.image_files)
+            self.detect_thread.start()
+
+        entry = self.detect_thread.request(self.current_image_index, self.parent.conf_threshold)
+        if entry is not None:
+            # 已预取，直接从内存显示
+            self.show_result(entry)
+            return
 
-        except Exception as e:
-            print(f"DEBUG: 检测异常: {e}")
-            import traceback
-            traceback.print_exc()
-            self.parent.log_message(f"❌ 检测失败: {e}")
-        finally:
-            self.detect_btn.setEnabled(True)
-            self.detect_btn.setText("开始检测")
+        self.detect_btn.setEnabled(False)
+        self.detect_btn.setText("分析中...")
+        self.status_label.setText(f"分析中: {self.current_image_name}")
+
+    def update_tiled(self, checked):
+        if self.detect_thread is not None:
+            self.detect_thread.set_tiled(checked)
+        self.parent.log_message("🧩 已开启分块检测" if checked else "🧩 已关闭分块检测")
+
+    def on_detection_result(self, index, entry):
+        if index == self.current_image_index:
+            self.show_result(entry)
+
+    def show_result(self, entry, log=True):
+        conf = self.parent.conf_threshold
+        if entry["conf"] != conf:
+            # 阈值变化只需重新过滤和绘制原始检测框，无需重新推理
+            shown = filter_detections(entry["dets"], conf)
+            entry["annotated"] = render_detections(entry["image"], shown, self.parent.model.names)
+            entry["count"] = len(shown)
+            entry["conf"] = conf
+
+        annotated_frame = entry["annotated"]
+        self.current_entry = entry
+        self.current_image = entry["image"]
+        self.current_result = annotated_frame
+        self.parent.display_owner = self
+        self.parent.display_image(annotated_frame)
+        self.save_btn.setEnabled(True)
+
+        count = entry["count"]
+        self.parent.update_stats(count, annotated_frame.shape[:2])
+
+        self.update_display_info()
+        if log:
+            self.parent.log_message(f"🔍 检测完成: {self.current_image_name} - 发现 {count} 个目标")
+        self.detect_btn.setEnabled(self.parent.model_ready)
+        self.detect_btn.setText("开始检测")
+
+    def apply_conf_threshold(self):
+        """阈值变化时立即刷新当前图片"""
+        if self.current_entry is not None and self.parent.display_owner is self:
+            self.show_result(self.current_entry, log=False)
+
+    def on_detection_failed(self, index, error):
+        if index != self.current_image_index:
+            return
+        self.update_display_info()
+        self.parent.log_message(f"❌ 检测失败: {error}")
+        self.detect_btn.setEnabled(self.parent.model_ready)
+        self.detect_btn.setText("开始检测")
+
+    def stop_detection(self):
+        if self.detect_thread is not None:
+            self.detect_thread.stop()
+            self.detect_thread.wait()
+            self.parent.finish_stats(self.detect_thread.stats)
+            self.detect_thread = None
 
     def save_current_result(self):
         if hasattr(self, 'current_result'):
@@ -720,15 +2403,30 @@ class VideoDetectionPage(QWidget):
         play_ctrls.addWidget(self.pause_btn)
         play_ctrls.addWidget(self.save_frame_btn)
 
+        self.roi_btn = StyledButton("设置检测区域", btn_type="Outlined", small=True)
+        self.roi_btn.clicked.connect(self.edit_roi)
+        self.roi_btn.setEnabled(False)
+
         ctrl_layout.addWidget(self.video_btn)
         ctrl_layout.addWidget(self.detect_btn)
         ctrl_layout.addLayout(play_ctrls)
+        ctrl_layout.addWidget(self.roi_btn)
         controls.setLayout(ctrl_layout)
         layout.addWidget(controls)
 
         self.save_video_checkbox = QCheckBox("导出检测视频")
         layout.addWidget(self.save_video_checkbox)
 
+        mode_layout = QHBoxLayout()
+        mode_layout.addWidget(QLabel("分析模式"))
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItem("逐帧播放", VideoThread.MODE_PLAYBACK)
+        self.mode_combo.addItem("实时同步（落后时丢帧）", VideoThread.MODE_REALTIME)
+        self.mode_combo.addItem("极速导出（仅间隔预览）", VideoThread.MODE_EXPORT)
+        self.mode_combo.currentIndexChanged.connect(self.update_mode)
+        mode_layout.addWidget(self.mode_combo, stretch=1)
+        layout.addLayout(mode_layout)
+
         self.progress_bar = QProgressBar()
         layout.addWidget(self.progress_bar)
 
@@ -751,7 +2449,8 @@ class VideoDetectionPage(QWidget):
         if path:
             self.video_path = path
             self.video_name = os.path.basename(path)  # 保存文件名
-            self.detect_btn.setEnabled(True)
+            self.detect_btn.setEnabled(self.parent.model_ready)
+            self.roi_btn.setEnabled(True)
             self.status_label.setText(f"已选择: {self.video_name}")
 
             # 显示视频信息
@@ -772,6 +2471,26 @@ class VideoDetectionPage(QWidget):
 
             self.parent.log_message(f"📁 载入视频: {self.video_name}")
 
+    def roi_key(self):
+        return f"video:{self.video_name}"
+
+    def edit_roi(self):
+        """在视频第一帧上绘制检测区域，按文件名保存，下次开始分析时生效"""
+        cap = cv2.VideoCapture(self.video_path)
+        ret, frame = cap.read()
+        cap.release()
+        if not ret:
+            self.parent.log_message("❌ 无法读取视频画面")
+            return
+        self.parent.edit_roi(self.roi_key(), frame, self.video_name)
+
+    def update_mode(self):
+        # 极速导出总是写出检测视频
+        export = self.mode_combo.currentData() == VideoThread.MODE_EXPORT
+        if export:
+            self.save_video_checkbox.setChecked(True)
+        self.save_video_checkbox.setEnabled(not export)
+
     def detect_video(self):
         if not hasattr(self, 'video_path') or self.parent.model is None:
             self.parent.log_message("❌ 请先选择视频文件")
@@ -783,12 +2502,23 @@ class VideoDetectionPage(QWidget):
                 self.parent.model,
                 self.save_video_checkbox.isChecked(),
                 self.parent.conf_threshold,
-                self.parent.output_dir
+                self.parent.output_dir,
+                mode=self.mode_combo.currentData(),
+                detect_interval=self.parent.detect_interval,
+                stats=self.parent.create_stats("video"),
+                batch_size=self.parent.video_batch_size,
+                roi=self.parent.roi_mask(self.roi_key())
             )
-            self.video_thread.frame_processed.connect(self.update_frame)
+            self.video_thread.progress_updated.connect(self.update_progress)
             self.video_thread.finished.connect(self.video_finished)
             self.video_thread.start()
 
+            # 按屏幕刷新率取最新帧，界面跟不上时中间帧只丢弃显示，不影响导出
+            self.display_timer = QTimer()
+            self.display_timer.timeout.connect(self.poll_frame)
+            self.display_timer.start(self.parent.display_interval)
+            self.mode_combo.setEnabled(False)
+
             # 设置按钮状态
             self.pause_btn.setEnabled(True)
             self.pause_btn.setText("暂停")
@@ -820,9 +2550,30 @@ class VideoDetectionPage(QWidget):
         else:
             self.parent.log_message("⚠️ 视频线程未运行")
 
+    def apply_conf_threshold(self, conf):
+        """阈值实时作用于正在分析的视频，暂停时立即重绘当前帧"""
+        if not hasattr(self, 'video_thread') or not self.video_thread.isRunning():
+            return
+        self.video_thread.conf_threshold = conf
+        if self.pause_btn.text() == "继续" and self.parent.display_owner is self:
+            frame = self.video_thread.render_last(conf)
+            if frame is not None:
+                self.current_video_frame = frame
+                self.parent.display_image(frame)
+
+    def apply_detect_interval(self, interval):
+        if hasattr(self, 'video_thread') and self.video_thread.isRunning():
+            self.video_thread.tracker.interval = interval
+
+    def poll_frame(self):
+        item = self.video_thread.mailbox.take()
+        if item is not None:
+            self.update_frame(*item)
+
     def update_frame(self, frame, current, total):
         try:
             self.current_video_frame = frame
+            self.parent.display_owner = self
             self.parent.display_image(frame)
             self.progress_bar.setValue(int((current / total) * 100))
 
@@ -834,12 +2585,28 @@ class VideoDetectionPage(QWidget):
         except Exception as e:
             print(f"更新帧错误: {e}")
 
+    def update_progress(self, current, total, fps, dropped):
+        """在进度条上显示处理速度、预计剩余时间和丢帧数"""
+        if total <= 0:
+            return
+        self.progress_bar.setValue(int((current / total) * 100))
+        remaining = int((total - current) / fps) if fps > 0 else 0
+        text = f"%p% | {fps:.1f} 帧/秒 | 剩余 {remaining // 60:02d}:{remaining % 60:02d}"
+        if self.video_thread.mode == VideoThread.MODE_REALTIME:
+            text += f" | 丢帧 {dropped}"
+        self.progress_bar.setFormat(text)
+
     def video_finished(self):
         try:
+            self.display_timer.stop()
+            self.poll_frame()  # 显示最后一帧
+            self.parent.finish_stats(self.video_thread.stats)
+            self.mode_combo.setEnabled(True)
+            self.progress_bar.setFormat("%p%")
             self.pause_btn.setEnabled(False)
             self.pause_btn.setText("暂停")
             self.save_frame_btn.setEnabled(False)
-            self.detect_btn.setEnabled(True)
+            self.detect_btn.setEnabled(self.parent.model_ready)
             self.status_label.setText(f"播放结束: {self.video_name}")
             self.progress_bar.setValue(100)
 
@@ -852,6 +2619,10 @@ class VideoDetectionPage(QWidget):
             else:
                 self.parent.log_message(f"✅ 视频分析完成: {self.video_name}")
 
+            if self.video_thread.mode == VideoThread.MODE_REALTIME:
+                self.parent.log_message(f"⏱️ 实时同步丢帧: 跳过解码 {self.video_thread.decode_dropped} 帧，"
+                                        f"跳过推理 {self.video_thread.infer_dropped} 帧")
+
         except Exception as e:
             print(f"视频结束处理错误: {e}")
 
@@ -871,6 +2642,7 @@ class CameraDetectionPage(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.parent = parent
+        self.latency_ms = None  # 平滑后的端到端延迟
         self.init_ui()
 
     def init_ui(self):
@@ -891,6 +2663,11 @@ class CameraDetectionPage(QWidget):
         controls = QGroupBox("设备控制")
         ctrl_layout = QVBoxLayout()
 
+        # 多路监控：逗号分隔的设备编号或视频流地址，共用同一个模型合批推理
+        self.source_edit = QLineEdit("0")
+        self.source_edit.setPlaceholderText("摄像头编号或地址，多路用逗号分隔，如 0,1")
+        ctrl_layout.addWidget(self.source_edit)
+
         self.start_btn = StyledButton("启动摄像头", btn_type="Filled")
         self.start_btn.clicked.connect(self.start_camera)
 
@@ -902,24 +2679,38 @@ class CameraDetectionPage(QWidget):
         self.save_btn.clicked.connect(self.save_camera_frame)
         self.save_btn.setEnabled(False)
 
+        self.roi_btn = StyledButton("设置检测区域", btn_type="Outlined")
+        self.roi_btn.clicked.connect(self.edit_roi)
+
         ctrl_layout.addWidget(self.start_btn)
         ctrl_layout.addWidget(self.stop_btn)
         ctrl_layout.addWidget(self.save_btn)
+        ctrl_layout.addWidget(self.roi_btn)
         controls.setLayout(ctrl_layout)
         layout.addWidget(controls)
 
         # 修改：添加录制状态标签
         self.save_check = QCheckBox("自动录制")
+        self.event_check = QCheckBox("仅在发现目标时录制（含预录）")
+        self.event_check.setChecked(True)
+        self.event_check.setEnabled(False)
+        self.save_check.toggled.connect(self.event_check.setEnabled)
         self.recording_status = QLabel("")
         self.recording_status.setStyleSheet("color: #d32f2f; font-weight: bold;")
 
         ctrl_layout.addWidget(self.save_check)
+        ctrl_layout.addWidget(self.event_check)
         ctrl_layout.addWidget(self.recording_status)
 
         self.status_label = QLabel("设备就绪")
         self.status_label.setAlignment(Qt.AlignCenter)
         layout.addWidget(self.status_label)
 
+        self.latency_label = QLabel("")
+        self.latency_label.setAlignment(Qt.AlignCenter)
+        self.latency_label.setStyleSheet(f"color: {MD3Styles.SECONDARY}; font-size: 12px;")
+        layout.addWidget(self.latency_label)
+
         layout.addStretch()
         self.setLayout(layout)
 
@@ -928,21 +2719,38 @@ class CameraDetectionPage(QWidget):
         try:
             # 获取录制状态
             save_video = self.save_check.isChecked()
+            event_record = None
+            if save_video and self.event_check.isChecked():
+                event_record = (self.parent.event_pre_roll, self.parent.event_quiet)
 
+            sources = parse_camera_sources(self.source_edit.text())
             self.camera_thread = CameraThread(
-                0,
+                sources,
                 self.parent.model,
                 self.parent.conf_threshold,
                 save_video,
-                self.parent.output_dir
+                self.parent.output_dir,
+                detect_interval=self.parent.detect_interval,
+                motion_threshold=self.parent.motion_threshold,
+                stats=self.parent.create_stats("camera"),
+                latency_budget=self.parent.latency_budget,
+                rois={source: self.parent.roi_mask(f"camera:{source}") for source in sources},
+                event_record=event_record
             )
-            self.camera_thread.frame_processed.connect(self.update_frame)
             self.camera_thread.start()
+            self.latency_ms = None
+
+            self.display_timer = QTimer()
+            self.display_timer.timeout.connect(self.poll_frame)
+            self.display_timer.start(self.parent.display_interval)
 
             self.start_btn.setEnabled(False)
+            self.source_edit.setEnabled(False)
+            self.save_check.setEnabled(False)
+            self.event_check.setEnabled(False)
             self.stop_btn.setEnabled(True)
             self.save_btn.setEnabled(True)
-            self.status_label.setText("监控运行中...")
+            self.status_label.setText("监控运行中..." if len(sources) == 1 else f"{len(sources)} 路监控运行中...")
 
             # 更新录制状态显示
             if save_video:
@@ -954,26 +2762,84 @@ class CameraDetectionPage(QWidget):
                 self.recording_status.setText("")  # 清空状态
                 self.parent.log_message("📹 摄像头已启动")
 
-            self.parent.camera_start_time = time.time()
-            self.parent.camera_frame_count = 0
-            self.parent.fps_timer = QTimer()
-            self.parent.fps_timer.timeout.connect(self.parent.update_fps)
-            self.parent.fps_timer.start(1000)
-
         except Exception as e:
             self.parent.log_message(f"❌ 启动失败: {e}")
 
+    def apply_conf_threshold(self, conf):
+        if hasattr(self, 'camera_thread') and self.camera_thread:
+            self.camera_thread.conf_threshold = conf
+
+    def apply_detect_interval(self, interval):
+        if hasattr(self, 'camera_thread') and self.camera_thread:
+            self.camera_thread.set_detect_interval(interval)
+
+    def apply_motion_threshold(self, threshold):
+        if hasattr(self, 'camera_thread') and self.camera_thread:
+            self.camera_thread.set_motion_threshold(threshold)
+
+    def edit_roi(self):
+        """为某一路摄像头绘制检测区域；运行中取该路最新画面并立即生效，否则临时打开摄像头取一帧"""
+        sources = parse_camera_sources(self.source_edit.text())
+        running = hasattr(self, 'camera_thread') and self.camera_thread and self.camera_thread.isRunning()
+        if running:
+            sources = [stream.source for stream in self.camera_thread.streams]
+        source = sources[0]
+        if len(sources) > 1:
+            names = [str(s) for s in sources]
+            name, ok = QInputDialog.getItem(self, "选择摄像头", "为哪一路设置检测区域：", names, 0, False)
+            if not ok:
+                return
+            source = sources[names.index(name)]
+
+        frame = None
+        stream = None
+        if running:
+            stream = next(s for s in self.camera_thread.streams if s.source == source)
+            frame = stream.frame
+        else:
+            cap = cv2.VideoCapture(source)
+            for _ in range(5):  # 部分摄像头前几帧曝光不稳定
+                ret, frame = cap.read()
+            cap.release()
+        if frame is None:
+            self.parent.log_message(f"❌ 无法读取摄像头画面: {source}")
+            return
+
+        key = f"camera:{source}"
+        if self.parent.edit_roi(key, frame, f"摄像头 {source}") and stream is not None:
+            stream.roi = self.parent.roi_mask(key)
+
+    def apply_latency_budget(self, budget):
+        if hasattr(self, 'camera_thread') and self.camera_thread:
+            self.camera_thread.latency.set_budget(budget)
+
     def update_recording_time(self):
+        if self.camera_thread.event_record:
+            clips, active = self.camera_thread.event_clips
+            state = "录制中" if active else "待命"
+            self.recording_status.setText(f"● 事件录像{state} | 已保存 {clips} 段")
+            return
         if hasattr(self, 'recording_start_time'):
             elapsed = int(time.time() - self.recording_start_time)
             minutes = elapsed // 60
             seconds = elapsed % 60
             self.recording_status.setText(f"● 录制中... {minutes:02d}:{seconds:02d}")
 
-    def update_frame(self, frame):
+    def poll_frame(self):
+        item = self.camera_thread.mailbox.take()
+        if item is not None:
+            self.update_frame(*item)
+
+    def update_frame(self, frame, captured_at):
         self.current_frame = frame
+        self.parent.display_owner = self
         self.parent.display_image(frame)
-        self.parent.camera_frame_count += 1
+
+        # 采集到显示的端到端延迟（指数平滑）
+        self.camera_thread.stats.record("latency", time.perf_counter() - captured_at)
+        latency = (time.perf_counter() - captured_at) * 1000
+        self.latency_ms = latency if self.latency_ms is None else 0.9 * self.latency_ms + 0.1 * latency
+        self.latency_label.setText(f"端到端延迟: {self.latency_ms:.0f} ms")
 
     def stop_camera(self):
         if hasattr(self, 'camera_thread') and self.camera_thread:
@@ -982,22 +2848,36 @@ class CameraDetectionPage(QWidget):
 
             self.camera_thread.stop()
             self.camera_thread.wait()
+            self.display_timer.stop()
+            self.parent.finish_stats(self.camera_thread.stats)
 
-            if hasattr(self.parent, 'fps_timer'):
+            if hasattr(self, 'recording_timer'):
                 self.recording_timer.stop()
 
-            self.start_btn.setEnabled(True)
+            self.start_btn.setEnabled(self.parent.model_ready)
+            self.source_edit.setEnabled(True)
             self.stop_btn.setEnabled(False)
             self.save_btn.setEnabled(False)
+            self.save_check.setEnabled(True)
+            self.event_check.setEnabled(self.save_check.isChecked())
             self.recording_status.setText("")  # 清空录制状态
+            self.latency_label.setText("")
             self.status_label.setText("已停止")
 
             # 记录录制完成信息
-            if was_recording:
+            if was_recording and self.camera_thread.event_record:
+                clips, _ = self.camera_thread.event_clips
+                self.parent.log_message(f"✅ 事件录像结束，共保存 {clips} 段，索引见 events/clips.csv")
+            elif was_recording:
                 self.parent.log_message("✅ 摄像头录制已完成并保存")
             else:
                 self.parent.log_message("📹 摄像头已停止")
 
+            if self.camera_thread.motion_threshold > 0:
+                skipped, total = self.camera_thread.gate_stats()
+                ratio = skipped / total if total else 0.0
+                self.parent.log_message(f"💤 运动门控跳过推理 {skipped}/{total} 帧 ({ratio:.0%})")
+
     def save_camera_frame(self):
         if hasattr(self, 'current_frame'):
             try:
@@ -1037,7 +2917,7 @@ class SettingsPage(QWidget):
         self.conf_val.setStyleSheet(f"color: {MD3Styles.PRIMARY}; font-weight: bold;")
 
         self.slider = QSlider(Qt.Horizontal)
-        self.slider.setRange(10, 90)
+        self.slider.setRange(int(CONF_FLOOR * 100), 90)
         self.slider.setValue(40)
         self.slider.valueChanged.connect(self.update_conf)
 
@@ -1051,6 +2931,105 @@ class SettingsPage(QWidget):
         conf_group.setLayout(conf_layout)
         layout.addWidget(conf_group)
 
+        perf_group = QGroupBox("性能优化")
+        perf_layout = QVBoxLayout()
+
+        interval_layout = QHBoxLayout()
+        interval_layout.addWidget(QLabel("检测间隔（帧）"))
+        self.interval_spin = QSpinBox()
+        self.interval_spin.setRange(1, 30)
+        self.interval_spin.setValue(self.parent.detect_interval)
+        self.interval_spin.valueChanged.connect(self.update_interval)
+        interval_layout.addWidget(self.interval_spin)
+        perf_layout.addLayout(interval_layout)
+        perf_layout.addWidget(QLabel("大于 1 时只在关键帧运行模型，中间帧用光流跟踪检测框。"))
+
+        batch_layout = QHBoxLayout()
+        batch_layout.addWidget(QLabel("导出批大小（帧）"))
+        self.batch_spin = QSpinBox()
+        self.batch_spin.setRange(1, 32)
+        self.batch_spin.setValue(self.parent.video_batch_size)
+        self.batch_spin.valueChanged.connect(self.update_batch_size)
+        batch_layout.addWidget(self.batch_spin)
+        perf_layout.addLayout(batch_layout)
+        perf_layout.addWidget(QLabel("极速导出视频时多帧合成一批推理，下次开始分析时生效。"))
+
+        motion_layout = QHBoxLayout()
+        motion_layout.addWidget(QLabel("运动门控阈值"))
+        self.motion_spin = QDoubleSpinBox()
+        self.motion_spin.setRange(0.0, 20.0)
+        self.motion_spin.setSingleStep(0.1)
+        self.motion_spin.setDecimals(1)
+        self.motion_spin.setSuffix(" %")
+        self.motion_spin.setValue(self.parent.motion_threshold)
+        self.motion_spin.valueChanged.connect(self.update_motion_threshold)
+        motion_layout.addWidget(self.motion_spin)
+        perf_layout.addLayout(motion_layout)
+        perf_layout.addWidget(QLabel("摄像头画面变化低于该比例时跳过推理，0 为关闭。"))
+
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("延迟预算"))
+        self.budget_spin = QSpinBox()
+        self.budget_spin.setRange(0, 1000)
+        self.budget_spin.setSingleStep(10)
+        self.budget_spin.setSuffix(" ms")
+        self.budget_spin.setValue(self.parent.latency_budget)
+        self.budget_spin.valueChanged.connect(self.update_latency_budget)
+        budget_layout.addWidget(self.budget_spin)
+        perf_layout.addLayout(budget_layout)
+        perf_layout.addWidget(QLabel("摄像头每帧处理超出预算时自动降低推理输入尺寸，0 为关闭。"))
+
+        backend_layout = QHBoxLayout()
+        backend_layout.addWidget(QLabel("推理后端"))
+        self.backend_combo = QComboBox()
+        for key, (name, _) in BACKENDS.items():
+            self.backend_combo.addItem(name, key)
+        self.backend_combo.setCurrentIndex(self.backend_combo.findData(self.parent.backend))
+        self.backend_combo.currentIndexChanged.connect(self.update_backend)
+        backend_layout.addWidget(self.backend_combo, stretch=1)
+        perf_layout.addLayout(backend_layout)
+        perf_layout.addWidget(QLabel("ONNX/OpenVINO 模型不存在时会由 best.pt 自动导出。"))
+
+        self.cascade_check = QCheckBox(f"级联模式（{CASCADE_MODEL} 复核）")
+        self.cascade_check.setChecked(self.parent.cascade)
+        self.cascade_check.toggled.connect(self.update_cascade)
+        perf_layout.addWidget(self.cascade_check)
+        perf_layout.addWidget(QLabel("best.pt 筛查每一帧，置信度不确定的目标和无目标的画面交给大模型复核。"))
+
+        self.trace_check = QCheckBox("记录性能追踪（CSV）")
+        self.trace_check.setChecked(self.parent.trace_enabled)
+        self.trace_check.toggled.connect(self.update_trace)
+        perf_layout.addWidget(self.trace_check)
+        perf_layout.addWidget(QLabel("下次开始检测时生效，追踪文件保存在 output/traces。"))
+
+        perf_group.setLayout(perf_layout)
+        layout.addWidget(perf_group)
+
+        event_group = QGroupBox("事件录像")
+        event_layout = QVBoxLayout()
+        pre_roll_layout = QHBoxLayout()
+        pre_roll_layout.addWidget(QLabel("预录时长"))
+        self.pre_roll_spin = QSpinBox()
+        self.pre_roll_spin.setRange(1, 30)
+        self.pre_roll_spin.setSuffix(" 秒")
+        self.pre_roll_spin.setValue(self.parent.event_pre_roll)
+        self.pre_roll_spin.valueChanged.connect(self.update_event_record)
+        pre_roll_layout.addWidget(self.pre_roll_spin)
+        event_layout.addLayout(pre_roll_layout)
+
+        quiet_layout = QHBoxLayout()
+        quiet_layout.addWidget(QLabel("无目标后结束"))
+        self.quiet_spin = QSpinBox()
+        self.quiet_spin.setRange(1, 120)
+        self.quiet_spin.setSuffix(" 秒")
+        self.quiet_spin.setValue(self.parent.event_quiet)
+        self.quiet_spin.valueChanged.connect(self.update_event_record)
+        quiet_layout.addWidget(self.quiet_spin)
+        event_layout.addLayout(quiet_layout)
+        event_layout.addWidget(QLabel("发现目标时连同之前的预录一起保存片段，下次启动摄像头时生效。"))
+        event_group.setLayout(event_layout)
+        layout.addWidget(event_group)
+
         info_group = QGroupBox("模型状态")
         info_layout = QVBoxLayout()
         self.model_status = QLabel("未加载")
@@ -1058,8 +3037,12 @@ class SettingsPage(QWidget):
         self.model_detail_btn.clicked.connect(self.show_details)
         self.model_detail_btn.setEnabled(False)
 
+        self.clear_cache_btn = StyledButton("清除检测缓存", btn_type="Outlined", small=True)
+        self.clear_cache_btn.clicked.connect(self.clear_cache)
+
         info_layout.addWidget(self.model_status)
         info_layout.addWidget(self.model_detail_btn)
+        info_layout.addWidget(self.clear_cache_btn)
         info_group.setLayout(info_layout)
         layout.addWidget(info_group)
 
@@ -1071,11 +3054,62 @@ class SettingsPage(QWidget):
         self.parent.conf_threshold = conf
         self.conf_val.setText(f"{conf:.2f}")
         self.parent.conf_display.setText(f"阈值: {conf:.2f}")
+        # 检测结果按最低阈值保留，调整阈值只需重新过滤，不必重新推理
+        self.parent.image_page.apply_conf_threshold()
+        self.parent.video_page.apply_conf_threshold(conf)
+        self.parent.camera_page.apply_conf_threshold(conf)
+
+    def update_interval(self, val):
+        self.parent.detect_interval = val
+        self.parent.video_page.apply_detect_interval(val)
+        self.parent.camera_page.apply_detect_interval(val)
+
+    def update_batch_size(self, val):
+        self.parent.video_batch_size = val
+
+    def update_backend(self):
+        backend = self.backend_combo.currentData()
+        if backend != self.parent.backend:
+            # 已在运行的视频/摄像头线程继续使用原模型，重新开始后切换到新后端
+            self.parent.load_model(backend)
+
+    def sync_backend(self):
+        """模型加载结束（或失败）后让后端下拉框和级联开关与实际使用的模型一致"""
+        self.backend_combo.setCurrentIndex(self.backend_combo.findData(self.parent.backend))
+        self.backend_combo.setEnabled(True)
+        self.parent.cascade = isinstance(self.parent.model, CascadeDetector)
+        self.cascade_check.setChecked(self.parent.cascade)
+        self.cascade_check.setEnabled(True)
+
+    def update_cascade(self, checked):
+        if checked == self.parent.cascade:
+            return
+        self.parent.cascade = checked
+        self.parent.load_model()
+
+    def update_trace(self, checked):
+        self.parent.trace_enabled = checked
+
+    def update_motion_threshold(self, val):
+        self.parent.motion_threshold = val
+        self.parent.camera_page.apply_motion_threshold(val)
+
+    def update_event_record(self):
+        self.parent.event_pre_roll = self.pre_roll_spin.value()
+        self.parent.event_quiet = self.quiet_spin.value()
+
+    def update_latency_budget(self, val):
+        self.parent.latency_budget = val
+        self.parent.camera_page.apply_latency_budget(val)
 
     def show_details(self):
         if self.parent.class_names:
             ClassDetailDialog(self.parent.class_names, self.parent).exec_()
 
+    def clear_cache(self):
+        self.parent.detection_cache.clear()
+        self.parent.log_message("🧹 检测缓存已清除")
+
 
 class FishDetectionGUI(QMainWindow):
     def __init__(self):
@@ -1095,17 +3129,44 @@ class FishDetectionGUI(QMainWindow):
 
 
         self.model = None
+        self.model_ready = False  # 模型加载并预热完成前禁用检测按钮
+        self.model_loader = None
         self.video_thread = None
         self.camera_thread = None
         self.output_dir = "output"
         self.class_names = []
         self.conf_threshold = 0.4
+        self.backend = "pytorch"  # 推理后端，见 BACKENDS
+        self.model_hash = ""
+        self.detect_interval = 1  # 每隔多少帧运行一次检测，中间帧用跟踪
+        self.video_batch_size = 8  # 极速导出视频时每批推理的帧数
+        self.motion_threshold = 0.0  # 摄像头运动门控阈值（变化像素占比 %），0 为关闭
+        self.latency_budget = 0  # 摄像头每帧处理耗时预算（毫秒），0 为关闭自适应输入尺寸
+        self.cascade = False  # 级联模式：best.pt 筛查，best_large.pt 复核
+        self.event_pre_roll = 5  # 事件录像的预录时长（秒）
+        self.event_quiet = 3  # 连续多少秒没有目标后结束事件片段
+        self.display_owner = None  # 最近一次在显示区绘图的页面
+        self._display_buffer = None  # display_image 复用的缩放缓冲区
+        self.active_stats = None  # 统计面板当前显示的流水线统计
+        self.trace_enabled = False  # 是否把流水线统计写入 CSV 追踪文件
         os.makedirs(self.output_dir, exist_ok=True)
+        self.detection_cache = DetectionCache(resolve_app_path("cache"))
+        self.roi_config = load_roi_config(resolve_app_path(ROI_CONFIG))
+
+        # 视频/摄像头画面按屏幕刷新率从帧邮箱取帧
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 60.0
+        self.display_interval = max(10, int(1000 / max(refresh_rate, 1.0)))
 
         self.setStyleSheet(MD3Styles.get_stylesheet())
         self.init_ui()
+        self.set_model_ready(False)
         self.load_model()
 
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats_panel)
+        self.stats_timer.start(1000)
+
     def init_ui(self):
         self.setWindowTitle("海洋鱼类智能识别系统")
         self.resize(1100, 750)
@@ -1184,11 +3245,19 @@ class FishDetectionGUI(QMainWindow):
         self.fps_label = QLabel("FPS: --")
         self.count_label = QLabel("目标数: 0")
         self.conf_display = QLabel(f"阈值: {self.conf_threshold:.2f}")
+        self.gate_label = QLabel("跳过推理: --")
+        self.backend_label = QLabel("推理: --")
 
-        for lbl in [self.fps_label, self.count_label, self.conf_display]:
+        for lbl in [self.fps_label, self.count_label, self.conf_display, self.gate_label, self.backend_label]:
             lbl.setStyleSheet(f"font-weight: bold; color: {MD3Styles.ON_PRIMARY_CONTAINER};")
             stats_layout.addWidget(lbl)
 
+        # 各阶段耗时分位数、队列深度、丢帧和内存
+        self.perf_label = QLabel("")
+        self.perf_label.setStyleSheet(f"color: {MD3Styles.ON_PRIMARY_CONTAINER}; font-size: 11px;")
+        self.perf_label.setWordWrap(True)
+        stats_layout.addWidget(self.perf_label)
+
         info_panel.addWidget(stats_frame)
 
         self.log_text = QTextEdit()
@@ -1211,29 +3280,97 @@ class FishDetectionGUI(QMainWindow):
         if name in widgets:
             self.control_stack.setCurrentWidget(widgets[name])
             if name == "settings" and self.model:
-                self.settings_page.model_status.setText("✅ 模型已加载")
+                self.settings_page.model_status.setText("✅ 模型已加载" if self.model_ready else "⏳ 模型加载中")
                 self.settings_page.model_detail_btn.setEnabled(True)
 
-    def load_model(self):
-        try:
-            # 判断是否是打包后的环境
-            if getattr(sys, 'frozen', False):
-                # 打包后，模型文件应该在exe同目录下
-                base_path = os.path.dirname(sys.executable)
-                model_path = os.path.join(base_path, "best.pt")
-            else:
-                # 开发环境中直接使用当前目录
-                model_path = "best.pt"
+    def load_model(self, backend=None):
+        """在后台线程加载并预热模型，完成前禁用检测按钮"""
+        backend = backend or self.backend
+        if self.model_loader is not None and self.model_loader.isRunning():
+            return
+        model_path = resolve_app_path()
+        if not os.path.exists(model_path):
+            self.log_message("⚠️ 模型文件未找到，请确保best.pt与本程序在同一目录下")
+            self.settings_page.sync_backend()
+            return
 
-            if not os.path.exists(model_path):
-                self.log_message("⚠️ 模型文件未找到，请确保best.pt与本程序在同一目录下")
+        if not os.path.exists(backend_artifact(model_path, backend)):
+            if not BACKENDS[backend][1]:
+                self.log_message("⚠️ 未找到量化模型，请先运行 quantize_model.py 生成 best_int8.onnx")
+                self.settings_page.sync_backend()
+                return
+            self.log_message(f"⏳ 正在导出 {BACKENDS[backend][0]} 模型，首次使用需要一些时间...")
+        else:
+            self.log_message(f"⏳ 正在后台加载模型（{BACKENDS[backend][0]}）...")
+
+        refine_path = None
+        if self.cascade:
+            refine_path = resolve_app_path(CASCADE_MODEL)
+            if not os.path.exists(refine_path):
+                self.log_message(f"⚠️ 未找到复核模型 {CASCADE_MODEL}，级联模式未开启")
+                self.settings_page.sync_backend()
                 return
 
-            self.model = YOLO(model_path)
-            self.class_names = list(self.model.names.values())
-            self.log_message("🎉 系统初始化完成，模型加载成功")
-        except Exception as e:
-            self.log_message(f"❌ 模型错误: {e}")
+        self.set_model_ready(False)
+        self.settings_page.backend_combo.setEnabled(False)
+        self.settings_page.cascade_check.setEnabled(False)
+        self.model_loader = ModelLoaderThread(model_path, backend, refine_path)
+        self.model_loader.loaded.connect(self.on_model_loaded)
+        self.model_loader.failed.connect(self.on_model_failed)
+        self.model_loader.start()
+
+    def on_model_loaded(self, model, backend, model_hash, timings):
+        self.model = model
+        self.backend = backend
+        self.model_hash = model_hash
+        self.class_names = list(self.model.names.values())
+        self.settings_page.sync_backend()
+        self.set_model_ready(True)
+        self.log_message(f"🎉 系统初始化完成，模型加载成功（{self.model.backend_name}）")
+        self.log_message(f"⏱️ 导入 {timings['import']:.1f}s | 加载 {timings['load']:.1f}s | "
+                         f"预热 {timings['warmup']:.1f}s")
+
+    def on_model_failed(self, error):
+        self.log_message(f"❌ 模型错误: {error}")
+        self.settings_page.sync_backend()
+        # 切换后端失败时继续使用原来的模型
+        self.set_model_ready(self.model is not None)
+
+    def set_model_ready(self, ready):
+        """按模型状态启用或禁用各页面的检测按钮"""
+        self.model_ready = ready
+        video_thread = getattr(self.video_page, 'video_thread', None)
+        camera_thread = getattr(self.camera_page, 'camera_thread', None)
+        self.image_page.detect_btn.setEnabled(ready and bool(self.image_page.image_files))
+        self.video_page.detect_btn.setEnabled(ready and hasattr(self.video_page, 'video_path')
+                                              and not (video_thread is not None and video_thread.isRunning()))
+        self.camera_page.start_btn.setEnabled(ready and not (camera_thread is not None and camera_thread.isRunning()))
+
+    def roi_mask(self, key):
+        """返回某个来源的检测区域，未设置时返回 None"""
+        mask = RegionMask(self.roi_config.get(key, []))
+        return mask if mask else None
+
+    def edit_roi(self, key, frame, title):
+        """打开检测区域编辑对话框，保存后返回 True"""
+        dialog = RoiEditorDialog(frame, self.roi_config.get(key, []), title, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return False
+        polygons = dialog.polygons()
+        if polygons:
+            self.roi_config[key] = polygons
+        else:
+            self.roi_config.pop(key, None)
+        try:
+            save_roi_config(resolve_app_path(ROI_CONFIG), self.roi_config)
+        except OSError as e:
+            self.log_message(f"❌ 保存检测区域失败: {e}")
+            return False
+        if polygons:
+            self.log_message(f"🎯 已保存 {title} 的 {len(polygons)} 个检测区域")
+        else:
+            self.log_message(f"🎯 已清除 {title} 的检测区域")
+        return True
 
     def log_message(self, msg):
         t = time.strftime("%H:%M:%S")
@@ -1241,39 +3378,78 @@ class FishDetectionGUI(QMainWindow):
         self.log_text.verticalScrollBar().setValue(self.log_text.verticalScrollBar().maximum())
 
     def read_image(self, path):
-        if path.lower().endswith('.webp'):
-            try:
-                return cv2.cvtColor(np.array(Image.open(path).convert('RGB')), cv2.COLOR_RGB2BGR)
-            except:
-                return None
-        return cv2.imread(path)
+        return read_image(path)
 
     def display_image(self, img):
         if img is None: return
-        h, w, ch = img.shape
-        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        qimg = QImage(rgb.data, w, h, ch * w, QImage.Format_RGB888)
-        self.display_label.setPixmap(QPixmap.fromImage(qimg).scaled(
-            self.display_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        start = time.perf_counter()
+        size = self.display_label.size()
+        qimg, self._display_buffer = frame_to_qimage(img, size.width(), size.height(), self._display_buffer)
+        self.display_label.setPixmap(QPixmap.fromImage(qimg))
+        if self.active_stats is not None:
+            self.active_stats.record("display", time.perf_counter() - start)
 
     def update_stats(self, count, res):
         self.count_label.setText(f"目标数: {count}")
 
-    def update_fps(self):
-        if hasattr(self, 'camera_start_time'):
-            elapsed = time.time() - self.camera_start_time
-            fps = self.camera_frame_count / elapsed if elapsed > 0 else 0
-            self.fps_label.setText(f"FPS: {fps:.1f}")
-            self.camera_frame_count = 0
-            self.camera_start_time = time.time()
+    def create_stats(self, name):
+        """为新启动的流水线创建统计对象，统计面板随之切换到该流水线"""
+        trace_path = None
+        if self.trace_enabled:
+            trace_path = os.path.join(self.output_dir, "traces", f"{name}_{int(time.time())}.csv")
+        self.active_stats = PipelineStats(name, trace_path)
+        return self.active_stats
+
+    def finish_stats(self, stats):
+        """流水线结束时关闭追踪文件；面板保留最后的统计"""
+        stats.close()
+        if stats.trace_path:
+            self.log_message(f"📈 性能追踪已保存: {stats.trace_path}")
+
+    def update_stats_panel(self):
+        """每秒刷新统计面板：推理后端耗时，以及当前流水线的帧率、各阶段耗时分位数、队列、丢帧和内存"""
+        if self.model is not None:
+            inference = self.model.speed.get('inference')
+            text = f"{inference:.1f} ms" if inference is not None else "--"
+            self.backend_label.setText(f"推理: {text} ({self.model.backend_name})")
+
+        camera_thread = getattr(self.camera_page, 'camera_thread', None)
+        if camera_thread is not None and camera_thread.isRunning() and camera_thread.motion_threshold > 0:
+            skipped, total = camera_thread.gate_stats()
+            self.gate_label.setText(f"跳过推理: {skipped / total if total else 0.0:.0%}")
+        else:
+            self.gate_label.setText("跳过推理: --")
+
+        if self.active_stats is None:
+            return
+        snap = self.active_stats.snapshot()
+        self.fps_label.setText(f"FPS: {snap['fps']:.1f}")
+        lines = ["耗时 p50/p95/p99 (ms)"]
+        for stage, (p50, p95, p99) in snap["stages"].items():
+            lines.append(f"{STAGE_NAMES.get(stage, stage)}: {p50:.1f} / {p95:.1f} / {p99:.1f}")
+        if snap["gauges"]:
+            lines.append(" | ".join(f"{GAUGE_NAMES.get(name, name)} {value}"
+                                    for name, value in snap["gauges"].items()))
+        if snap["rss_mb"] is not None:
+            lines.append(f"内存: {snap['rss_mb']:.0f} MB")
+        if isinstance(self.model, CascadeDetector):
+            lines.append(self.model.summary())
+        self.perf_label.setText("\n".join(lines))
 
     def closeEvent(self, event):
-        if self.video_thread and self.video_thread.isRunning():
-            self.video_thread.stop()
-            self.video_thread.wait()
-        if self.camera_thread and self.camera_thread.isRunning():
-            self.camera_thread.stop()
-            self.camera_thread.wait()
+        if self.model_loader is not None and self.model_loader.isRunning():
+            self.model_loader.wait()
+        # 视频线程由视频页面持有，关闭窗口时也要停止各流水线阶段、收尾导出的视频
+        video_thread = getattr(self.video_page, 'video_thread', None) or self.video_thread
+        if video_thread and video_thread.isRunning():
+            video_thread.stop()
+            video_thread.wait()
+        # 摄像头线程由监控页面持有，关闭窗口时也要停止采集线程、收尾录像
+        camera_thread = getattr(self.camera_page, 'camera_thread', None) or self.camera_thread
+        if camera_thread and camera_thread.isRunning():
+            camera_thread.stop()
+            camera_thread.wait()
+        self.image_page.stop_detection()
         event.accept()
 
 
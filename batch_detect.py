@@ -0,0 +1,149 @@
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import time
+
+import cv2
+
+from app import IMAGE_EXTENSIONS, extract_detections, read_image, render_detections, resolve_app_path, tiled_detect
+
+# 工作进程内的模型实例（每个进程各自持有一份）
+_model = None
+
+
+def collect_images(input_dir, recursive=True):
+    """遍历目录，返回排序后的图片路径列表"""
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return sorted(paths)
+
+
+def result_path(image_path, input_dir, output_dir):
+    """按输入目录的相对结构生成结果图片路径；保留原扩展名，同名的 a.jpg 与 a.png 不会互相覆盖"""
+    rel = os.path.relpath(image_path, input_dir)
+    return os.path.join(output_dir, f"{rel}_result.jpg")
+
+
+def init_worker(model_path, threads):
+    """工作进程初始化：限制线程数并加载模型"""
+    global _model
+    # 多进程并行时每个进程只用少量线程，避免进程之间争抢CPU核心
+    cv2.setNumThreads(1)
+    import torch
+    torch.set_num_threads(threads)
+    from ultralytics import YOLO
+    _model = YOLO(model_path)
+
+
+def detect_one(task):
+    """检测单张图片，返回该图片的检测摘要"""
+    path, out_path, conf, tiled = task
+    record = {"file": path, "count": 0, "species": {}, "boxes": [], "infer_ms": 0.0, "error": ""}
+
+    image = read_image(path)
+    if image is None:
+        record["error"] = "读取失败"
+        return record
+
+    try:
+        start = time.perf_counter()
+        if tiled:
+            dets = tiled_detect(_model, image, conf=conf)
+        else:
+            dets = extract_detections(_model(image, conf=conf, verbose=False)[0])
+        record["infer_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        for x1, y1, x2, y2, score, cls in dets.tolist():
+            name = _model.names[int(cls)]
+            record["species"][name] = record["species"].get(name, 0) + 1
+            record["boxes"].append({"class": name, "conf": round(score, 4),
+                                    "xyxy": [round(v, 1) for v in (x1, y1, x2, y2)]})
+        record["count"] = len(record["boxes"])
+
+        if out_path:
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+            cv2.imwrite(out_path, render_detections(image, dets, _model.names))
+    except Exception as e:
+        record["error"] = str(e)
+    return record
+
+
+def run_batch(input_dir, output_dir, workers, conf=0.4, model_path=None, threads=1,
+              save_images=True, recursive=True, tiled=False):
+    """多进程批量检测，结果图片与摘要写入 output_dir"""
+    model_path = model_path or resolve_app_path()
+    if not os.path.exists(model_path):
+        print(f"模型文件未找到: {model_path}")
+        return
+
+    images = collect_images(input_dir, recursive)
+    if not images:
+        print(f"目录中没有图片: {input_dir}")
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(p, result_path(p, input_dir, output_dir) if save_images else None, conf, tiled) for p in images]
+    # 小块分发：既减少进程间通信，又能让快的进程多领任务
+    chunksize = max(1, min(16, len(tasks) // (workers * 8)))
+
+    print(f"共 {len(images)} 张图片，{workers} 个工作进程，每进程 {threads} 线程")
+    total_found = failed = 0
+    start = time.perf_counter()
+    first_done = None
+
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(workers, initializer=init_worker, initargs=(model_path, threads)) as pool, \
+            open(os.path.join(output_dir, "detections.jsonl"), "w", encoding="utf-8") as jsonl_file, \
+            open(os.path.join(output_dir, "summary.csv"), "w", newline="", encoding="utf-8-sig") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["file", "count", "species", "infer_ms", "error"])
+
+        for i, record in enumerate(pool.imap_unordered(detect_one, tasks, chunksize=chunksize), 1):
+            if first_done is None:
+                first_done = time.perf_counter()
+            total_found += record["count"]
+            failed += bool(record["error"])
+
+            jsonl_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            species = ";".join(f"{k}:{v}" for k, v in sorted(record["species"].items()))
+            writer.writerow([os.path.relpath(record["file"], input_dir), record["count"],
+                             species, record["infer_ms"], record["error"]])
+
+            if i % 100 == 0 or i == len(tasks):
+                elapsed = time.perf_counter() - start
+                print(f"进度 {i}/{len(tasks)} | {i / elapsed:.2f} 张/秒")
+
+    elapsed = time.perf_counter() - start
+    # 稳态吞吐量不含模型加载时间
+    steady = (len(tasks) - 1) / (time.perf_counter() - first_done) if len(tasks) > 1 else 0
+    print(f"完成: {len(tasks)} 张，发现 {total_found} 个目标，失败 {failed} 张")
+    print(f"总耗时 {elapsed:.1f}s | 平均 {len(tasks) / elapsed:.2f} 张/秒 | 稳态 {steady:.2f} 张/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="海洋鱼类批量检测（无界面）")
+    parser.add_argument("input_dir", help="图片目录")
+    parser.add_argument("-o", "--output", default="output/batch", help="结果输出目录")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="每个进程的推理线程数")
+    parser.add_argument("--conf", type=float, default=0.4, help="置信度阈值")
+    parser.add_argument("--model", default=None, help="模型文件路径，默认 best.pt")
+    parser.add_argument("--no-images", action="store_true", help="只输出检测摘要，不保存标注图片")
+    parser.add_argument("--no-recursive", action="store_true", help="不遍历子目录")
+    parser.add_argument("--tiled", action="store_true", help="高分辨率图片分块推理，检出更小的目标")
+    args = parser.parse_args()
+
+    run_batch(args.input_dir, args.output, max(1, args.workers), args.conf, args.model,
+              max(1, args.threads), not args.no_images, not args.no_recursive, args.tiled)
+
+
+if __name__ == '__main__':
+    mp.freeze_support()
+    main()
@@ -0,0 +1,361 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+# 无显示环境下使用 offscreen 平台，便于在服务器上运行
+if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication
+
+from app import BACKENDS, CONF_FLOOR, Detector, extract_detections, frame_to_qimage, read_image, render_detections, \
+    resolve_app_path
+
+# 流水线各阶段，按处理顺序排列
+PIPELINE_STAGES = ("decode", "preprocess", "inference", "nms", "plot", "write", "display", "total")
+
+
+def summarize(times):
+    """把一组耗时（秒）汇总为毫秒统计"""
+    ms = np.asarray(times) * 1000
+    return {
+        "n": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+    }
+
+
+def parse_size(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+
+def synthetic_frames(width, height, count, seed=0):
+    """生成带噪声和色块的合成帧，避免纯色图让缩放过快"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(count):
+        frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        cx = int((i * 37) % width)
+        cv2.rectangle(frame, (cx, height // 3), (min(width - 1, cx + width // 6), height // 2), (0, 200, 255), 4)
+        frames.append(frame)
+    return frames
+
+
+def scene_frame(width, height, index, seed=0):
+    """生成类似水族箱画面的合成帧：渐变背景、游动的椭圆“鱼”和轻微噪声"""
+    rng = np.random.default_rng(seed + index)
+    gradient = np.linspace(60, 160, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:, :, 0] = np.clip(gradient + 40, 0, 255).astype(np.uint8)
+    frame[:, :, 1] = gradient.astype(np.uint8)
+    frame[:, :, 2] = (gradient * 0.4).astype(np.uint8)
+    unit = min(width, height)
+    for k in range(6):
+        cx = int((width * (k + 1) / 7 + index * (3 + k) * unit / 200) % width)
+        cy = int(height * (0.2 + 0.12 * k))
+        axes = (int(unit * (0.04 + 0.01 * k)), int(unit * (0.015 + 0.004 * k)))
+        color = (int(30 + 35 * k) % 255, int(140 + 20 * k) % 255, int(220 - 30 * k) % 255)
+        cv2.ellipse(frame, (cx, cy), axes, 0, 0, 360, color, -1)
+    noise = rng.integers(-8, 9, (height, width, 1), dtype=np.int16)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def make_video(path, width, height, count, fps=25.0):
+    """写出合成测试视频（mp4v 编码，与导出视频一致）"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for i in range(count):
+        writer.write(scene_frame(width, height, i))
+    writer.release()
+    return path
+
+
+def make_images(directory, width, height, count):
+    """写出合成测试图片集（JPEG）"""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"synthetic_{i:04d}.jpg")
+        cv2.imwrite(path, scene_frame(width, height, 1000 + i))
+        paths.append(path)
+    return paths
+
+
+def legacy_display(img, width, height):
+    """原显示路径：整幅 BGR→RGB 转换 + QImage + 平滑缩放"""
+    h, w, ch = img.shape
+    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    qimg = QImage(rgb.data, w, h, ch * w, QImage.Format_RGB888)
+    return QPixmap.fromImage(qimg).scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+def bench_display(frame_size, label_size, count, repeat=3):
+    """比较原显示路径与 frame_to_qimage 路径的每帧耗时"""
+    app = QApplication.instance() or QApplication(sys.argv)
+    # 少量不同的帧循环使用，避免大尺寸帧占用过多内存
+    frames = synthetic_frames(frame_size[0], frame_size[1], min(count, 8))
+    label_w, label_h = label_size
+
+    def run(fn):
+        times = []
+        for _ in range(repeat):
+            for i in range(count):
+                frame = frames[i % len(frames)]
+                start = time.perf_counter()
+                fn(frame)
+                times.append(time.perf_counter() - start)
+        return summarize(times)
+
+    buffer = None
+
+    def fast(frame):
+        nonlocal buffer
+        qimg, buffer = frame_to_qimage(frame, label_w, label_h, buffer)
+        return QPixmap.fromImage(qimg)
+
+    legacy = run(lambda frame: legacy_display(frame, label_w, label_h))
+    current = run(fast)
+    app.processEvents()
+    return {
+        "frame_size": list(frame_size),
+        "label_size": list(label_size),
+        "legacy": legacy,
+        "fast": current,
+        "speedup": round(legacy["mean_ms"] / current["mean_ms"], 2) if current["mean_ms"] > 0 else None,
+    }
+
+
+class StageTimer:
+    """按阶段收集每帧耗时（秒），前 warmup 帧不计入"""
+
+    def __init__(self, warmup=0):
+        self.warmup = warmup
+        self.times = {stage: [] for stage in PIPELINE_STAGES}
+        self._frames = 0
+
+    def add_frame(self, timings):
+        self._frames += 1
+        if self._frames <= self.warmup:
+            return
+        for stage, seconds in timings.items():
+            self.times[stage].append(seconds)
+
+    def summary(self):
+        return {stage: summarize(times) for stage, times in self.times.items() if times}
+
+
+def process_frame(model, frame, decode_time, label_size, writer=None, buffer=None):
+    """按界面中的处理顺序跑完一帧，返回 (各阶段耗时, 显示缓冲区)"""
+    start = time.perf_counter()
+    results = model(frame, conf=CONF_FLOOR, verbose=False)
+    speed = results[0].speed  # 毫秒，ultralytics 自己统计的预处理/推理/NMS 耗时
+    timings = {
+        "decode": decode_time,
+        "preprocess": (speed.get("preprocess") or 0.0) / 1000,
+        "inference": (speed.get("inference") or 0.0) / 1000,
+        "nms": (speed.get("postprocess") or 0.0) / 1000,
+    }
+    dets = extract_detections(results[0])
+
+    t = time.perf_counter()
+    annotated = render_detections(frame, dets, model.names)
+    timings["plot"] = time.perf_counter() - t
+
+    if writer is not None:
+        t = time.perf_counter()
+        writer.write(annotated)
+        timings["write"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    qimg, buffer = frame_to_qimage(annotated, label_size[0], label_size[1], buffer)
+    QPixmap.fromImage(qimg)
+    timings["display"] = time.perf_counter() - t
+    timings["total"] = decode_time + time.perf_counter() - start
+    return timings, buffer
+
+
+def bench_pipeline(model, work_dir, frame_size, image_size, label_size, frames=60, images=20, warmup=3):
+    """在合成视频和图片集上统计视频/图片两条流水线各阶段的耗时"""
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    # 视频流水线：解码 -> 推理 -> 绘制 -> 写视频 -> 显示（对应 VideoThread / CameraThread）
+    video_path = make_video(os.path.join(work_dir, "synthetic.mp4"), frame_size[0], frame_size[1], frames)
+    cap = cv2.VideoCapture(video_path)
+    writer = cv2.VideoWriter(os.path.join(work_dir, "output.mp4"), cv2.VideoWriter_fourcc(*'mp4v'),
+                             25.0, tuple(frame_size))
+    video = StageTimer(warmup)
+    buffer = None
+    while True:
+        t = time.perf_counter()
+        ret, frame = cap.read()
+        decode_time = time.perf_counter() - t
+        if not ret:
+            break
+        timings, buffer = process_frame(model, frame, decode_time, label_size, writer, buffer)
+        video.add_frame(timings)
+    cap.release()
+    writer.release()
+
+    # 图片流水线：读图 -> 推理 -> 绘制 -> 显示（对应图片检测页面）
+    image_set = StageTimer(warmup)
+    buffer = None
+    for path in make_images(work_dir, image_size[0], image_size[1], images):
+        t = time.perf_counter()
+        image = read_image(path)
+        decode_time = time.perf_counter() - t
+        timings, buffer = process_frame(model, image, decode_time, label_size, buffer=buffer)
+        image_set.add_frame(timings)
+
+    app.processEvents()
+    return {"video": video.summary(), "images": image_set.summary()}
+
+
+def bench_batch(model, frame_size, sizes, frames=64, warmup=2):
+    """不同批大小下的推理吞吐量（帧/秒），模拟极速导出时的合批推理"""
+    pool = [scene_frame(frame_size[0], frame_size[1], i) for i in range(min(frames, 16))]
+    video = [pool[i % len(pool)] for i in range(frames)]
+    rows = []
+    for size in sizes:
+        for _ in range(warmup):
+            model(video[:size], conf=CONF_FLOOR, verbose=False)
+        times = []
+        start = time.perf_counter()
+        for i in range(0, frames, size):
+            t = time.perf_counter()
+            model(video[i:i + size], conf=CONF_FLOOR, verbose=False)
+            times.append((time.perf_counter() - t) / len(video[i:i + size]))
+        elapsed = time.perf_counter() - start
+        rows.append({"batch": size, "fps": round(frames / elapsed, 2), "per_frame": summarize(times)})
+    return rows
+
+
+def environment_info(backend):
+    """记录运行环境，便于对比不同版本或机器上的结果"""
+    import torch
+    import ultralytics
+    return {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "ultralytics": ultralytics.__version__,
+        "opencv": cv2.__version__,
+        "backend": backend,
+    }
+
+
+def compare(result, baseline, tolerance):
+    """与基线结果逐阶段比较 p50 耗时，返回超出容差的阶段列表"""
+    regressions = []
+    for pipeline in ("video", "images"):
+        for stage, current in result.get(pipeline, {}).items():
+            previous = baseline.get(pipeline, {}).get(stage)
+            if not previous or previous["p50_ms"] <= 0:
+                continue
+            ratio = current["p50_ms"] / previous["p50_ms"]
+            mark = ""
+            # 小于 0.5 ms 的阶段抖动太大，只显示不判定
+            if ratio > 1 + tolerance and current["p50_ms"] - previous["p50_ms"] > 0.5:
+                regressions.append(f"{pipeline}.{stage}")
+                mark = "  <-- 回退"
+            print(f"{pipeline + '.' + stage:<22}{previous['p50_ms']:>10.2f}{current['p50_ms']:>10.2f}"
+                  f"{ratio:>9.2f}x{mark}")
+    return regressions
+
+
+def print_pipeline(result):
+    for pipeline, title in (("video", "视频流水线"), ("images", "图片流水线")):
+        print(f"{title}（毫秒）")
+        print(f"{'阶段':<12}{'平均':>10}{'p50':>10}{'p95':>10}")
+        for stage, stats in result[pipeline].items():
+            print(f"{stage:<12}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检测流程性能基准")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    display = sub.add_parser("display", help="比较 display_image 新旧显示路径")
+    display.add_argument("--frame", type=parse_size, default=(1920, 1080), help="帧尺寸，如 1920x1080")
+    display.add_argument("--label", type=parse_size, default=(960, 540), help="显示区尺寸，如 960x540")
+    display.add_argument("--frames", type=int, default=100, help="合成帧数")
+    display.add_argument("--json", default=None, help="结果写入 JSON 文件")
+
+    pipeline = sub.add_parser("pipeline", help="在合成视频和图片集上统计各阶段耗时")
+    pipeline.add_argument("--model", default=None, help="模型文件路径，默认 best.pt")
+    pipeline.add_argument("--backend", default="pytorch", choices=list(BACKENDS), help="推理后端")
+    pipeline.add_argument("--frame", type=parse_size, default=(1280, 720), help="视频帧尺寸")
+    pipeline.add_argument("--image", type=parse_size, default=(1920, 1080), help="图片尺寸")
+    pipeline.add_argument("--label", type=parse_size, default=(960, 540), help="显示区尺寸")
+    pipeline.add_argument("--frames", type=int, default=60, help="合成视频帧数")
+    pipeline.add_argument("--images", type=int, default=20, help="合成图片张数")
+    pipeline.add_argument("--warmup", type=int, default=3, help="不计入统计的预热帧数")
+    pipeline.add_argument("--json", default=None, help="结果写入 JSON 文件")
+    pipeline.add_argument("--baseline", default=None, help="与之前保存的 JSON 结果比较")
+    pipeline.add_argument("--tolerance", type=float, default=0.2, help="p50 耗时允许的增幅，超出则返回非零")
+
+    batch = sub.add_parser("batch", help="统计不同批大小下的视频推理吞吐量")
+    batch.add_argument("--model", default=None, help="模型文件路径，默认 best.pt")
+    batch.add_argument("--backend", default="pytorch", choices=list(BACKENDS), help="推理后端")
+    batch.add_argument("--frame", type=parse_size, default=(1280, 720), help="视频帧尺寸")
+    batch.add_argument("--sizes", default="1,2,4,8,16", help="批大小列表，逗号分隔")
+    batch.add_argument("--frames", type=int, default=64, help="每种批大小推理的帧数")
+    batch.add_argument("--json", default=None, help="结果写入 JSON 文件")
+
+    args = parser.parse_args()
+    if args.command == "batch":
+        model = Detector.load(args.model or resolve_app_path(), args.backend)
+        sizes = [int(v) for v in args.sizes.split(',') if v.strip()]
+        rows = bench_batch(model, args.frame, sizes, args.frames)
+        print(f"{'批大小':<8}{'帧/秒':>10}{'单帧p50(ms)':>14}{'单帧p95(ms)':>14}")
+        for row in rows:
+            print(f"{row['batch']:<8}{row['fps']:>10.2f}{row['per_frame']['p50_ms']:>14.2f}"
+                  f"{row['per_frame']['p95_ms']:>14.2f}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"environment": environment_info(args.backend), "frame": list(args.frame),
+                           "results": rows}, f, ensure_ascii=False, indent=2)
+    elif args.command == "pipeline":
+        model = Detector.load(args.model or resolve_app_path(), args.backend)
+        with tempfile.TemporaryDirectory(prefix="fish_bench_") as work_dir:
+            result = bench_pipeline(model, work_dir, args.frame, args.image, args.label,
+                                    args.frames, args.images, args.warmup)
+        result["environment"] = environment_info(args.backend)
+        result["config"] = {"frame": list(args.frame), "image": list(args.image), "label": list(args.label),
+                            "frames": args.frames, "images": args.images, "warmup": args.warmup}
+        print_pipeline(result)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            print(f"{'阶段':<22}{'基线p50':>10}{'当前p50':>10}{'比例':>10}")
+            regressions = compare(result, baseline, args.tolerance)
+            if regressions:
+                print(f"性能回退: {', '.join(regressions)}")
+                sys.exit(1)
+            print("未发现性能回退")
+    elif args.command == "display":
+        result = bench_display(args.frame, args.label, args.frames)
+        print(f"原路径: 平均 {result['legacy']['mean_ms']:.2f} ms | p95 {result['legacy']['p95_ms']:.2f} ms")
+        print(f"新路径: 平均 {result['fast']['mean_ms']:.2f} ms | p95 {result['fast']['p95_ms']:.2f} ms")
+        print(f"加速比: {result['speedup']}x")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+
+import cv2
+import numpy as np
+import onnx
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quantize_static)
+from ultralytics import YOLO
+from ultralytics.data.utils import check_det_dataset
+
+from app import IMAGE_EXTENSIONS, backend_artifact, read_image, resolve_app_path
+
+
+def list_images(source):
+    """数据集中的图片列表：支持目录、txt 清单或它们的列表"""
+    if isinstance(source, (list, tuple)):
+        return [p for s in source for p in list_images(s)]
+    if os.path.isfile(source) and source.endswith('.txt'):
+        base = os.path.dirname(source)
+        with open(source, encoding='utf-8') as f:
+            return [os.path.join(base, line.strip()) for line in f if line.strip()]
+    paths = []
+    for root, _, files in os.walk(source):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def preprocess(image, size):
+    """与 ultralytics 一致的 letterbox 预处理，输出 1x3xHxW 的 float32"""
+    h, w = image.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = round(h * r), round(w * r)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    blob = canvas[:, :, ::-1].transpose(2, 0, 1)
+    return (np.ascontiguousarray(blob, dtype=np.float32) / 255.0)[None]
+
+
+class CalibrationReader(CalibrationDataReader):
+    """校准数据：逐张读取训练集子集"""
+
+    def __init__(self, image_paths, input_name, imgsz):
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._paths = iter(image_paths)
+
+    def get_next(self):
+        for path in self._paths:
+            image = read_image(path)
+            if image is not None:
+                return {self.input_name: preprocess(image, self.imgsz)}
+        return None
+
+
+def head_nodes(model):
+    """检测头（最后一层）的节点名，默认不量化以保持框坐标和分数精度"""
+    layers = []
+    for node in model.graph.node:
+        match = re.match(r'/model\.(\d+)/', node.name)
+        if match:
+            layers.append(int(match.group(1)))
+    if not layers:
+        return []
+    prefix = f"/model.{max(layers)}/"
+    return [node.name for node in model.graph.node if node.name.startswith(prefix)]
+
+
+def quantize(model_path, data, output_path, work_dir, calib_images=200, imgsz=640, quantize_head=False, seed=0):
+    """由 best.pt 导出 FP32 ONNX，并用训练集子集做静态 INT8 量化，返回 FP32 ONNX 路径"""
+    os.makedirs(work_dir, exist_ok=True)
+    # 在工作目录中导出，避免覆盖程序目录下动态导出的 best.onnx
+    work_weights = os.path.join(work_dir, os.path.basename(model_path))
+    shutil.copy2(model_path, work_weights)
+    fp32_path = YOLO(work_weights).export(format='onnx', imgsz=imgsz, dynamic=True)
+
+    dataset = check_det_dataset(data)
+    images = list_images(dataset['train'])
+    if not images:
+        raise RuntimeError(f"数据集中没有找到训练图片: {dataset['train']}")
+    random.Random(seed).shuffle(images)
+    images = images[:calib_images]
+    print(f"校准图片: {len(images)} 张")
+
+    fp32_model = onnx.load(fp32_path)
+    input_name = fp32_model.graph.input[0].name
+    exclude = [] if quantize_head else head_nodes(fp32_model)
+    quantize_static(
+        fp32_path, output_path,
+        CalibrationReader(images, input_name, imgsz),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=exclude,
+    )
+
+    # 复制类别名、步长等元数据，量化模型才能被 YOLO 直接加载
+    int8_model = onnx.load(output_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, output_path)
+    print(f"INT8 模型已保存: {output_path}")
+    return fp32_path
+
+
+def evaluate(path, data, imgsz):
+    """在验证集上评估 mAP 和单张 CPU 推理耗时"""
+    metrics = YOLO(path, task='detect').val(data=data, imgsz=imgsz, batch=1, device='cpu',
+                                            plots=False, verbose=False)
+    return {
+        "model": path,
+        "mAP50": round(float(metrics.box.map50), 4),
+        "mAP50-95": round(float(metrics.box.map), 4),
+        "inference_ms": round(float(metrics.speed['inference']), 2),
+        "total_ms": round(float(sum(v for v in metrics.speed.values() if v)), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成 INT8 量化模型并与 FP32 模型比较精度和耗时")
+    parser.add_argument("--model", default=None, help="模型文件路径，默认 best.pt")
+    parser.add_argument("--data", default="datasets/data.yaml", help="数据集配置")
+    parser.add_argument("--calib", type=int, default=200, help="校准图片数量")
+    parser.add_argument("--imgsz", type=int, default=640, help="输入尺寸")
+    parser.add_argument("--work-dir", default="runs/quantize", help="中间文件目录")
+    parser.add_argument("--quantize-head", action="store_true", help="同时量化检测头（更快，但精度下降更多）")
+    parser.add_argument("--skip-eval", action="store_true", help="只生成模型，不做评估")
+    args = parser.parse_args()
+
+    model_path = args.model or resolve_app_path()
+    # 输出到 best.pt 旁边，程序中选择“ONNX INT8”后端即可直接加载
+    output_path = backend_artifact(model_path, "onnx_int8")
+    fp32_path = quantize(model_path, args.data, output_path, args.work_dir, args.calib, args.imgsz,
+                         args.quantize_head)
+    if args.skip_eval:
+        return
+
+    report = [evaluate(p, args.data, args.imgsz) for p in (fp32_path, output_path)]
+    print(f"{'模型':<10}{'mAP50':>10}{'mAP50-95':>12}{'推理(ms)':>12}{'总计(ms)':>12}")
+    for name, row in zip(("FP32", "INT8"), report):
+        print(f"{name:<10}{row['mAP50']:>10.4f}{row['mAP50-95']:>12.4f}{row['inference_ms']:>12.2f}"
+              f"{row['total_ms']:>12.2f}")
+    fp32, int8 = report
+    if int8['inference_ms'] > 0:
+        print(f"推理加速 {fp32['inference_ms'] / int8['inference_ms']:.2f}x，"
+              f"mAP50-95 变化 {int8['mAP50-95'] - fp32['mAP50-95']:+.4f}")
+
+    report_path = os.path.join(args.work_dir, "report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"fp32": fp32, "int8": int8}, f, ensure_ascii=False, indent=2)
+    print(f"报告已保存: {report_path}")
+
+
+if __name__ == '__main__':
+    main()